@@ -1,11 +1,18 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import os
-import json
+import io
+import orjson
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import base64
-import time
+import hashlib
+
+# Padrão para localizar o array JSON na resposta do modelo
+_JSON_ARRAY_RE = re.compile(r'\[\s*{.*}\s*\]', re.DOTALL)
+
+# Tempo limite (conexão, leitura) das requisições à API Gemini, em segundos
+_HTTP_TIMEOUT = (5, 60)
+_GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
 
 # Configuração da página
 st.set_page_config(
@@ -24,39 +31,62 @@ def get_gemini_api_key():
     return api_key
 
 # --------- FUNÇÕES DE PROCESSAMENTO GEMINI API ---------
-def query_gemini_api(prompt, temperature=0.2):
-    """Consulta a API Gemini para geração de conteúdo."""
-    api_key = get_gemini_api_key()
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    
-    headers = {'Content-Type': 'application/json'}
+@st.cache_resource
+def _get_http_session():
+    """Sessão HTTP reutilizada entre execuções (evita novo handshake TLS)."""
+    session = requests.Session()
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'x-goog-api-key': get_gemini_api_key()
+    })
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+def _prompt_cache_key(prompt, temperature, max_tokens):
+    """Gera a chave de cache (SHA-256) de uma consulta à API Gemini."""
+    payload = orjson.dumps({
+        "prompt": " ".join(prompt.split()),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "model": "gemini-2.0-flash"
+    }, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _gemini_generate(prompt_key, temperature, max_tokens, _prompt):
+    """Chama a API Gemini com resultado em cache; erros não são armazenados."""
     data = {
         "contents": [
             {
                 "parts": [
                     {
-                        "text": prompt
+                        "text": _prompt
                     }
                 ]
             }
         ],
         "generationConfig": {
             "temperature": temperature,
-            "maxOutputTokens": 2048
+            "maxOutputTokens": max_tokens
         }
     }
     
+    response = _get_http_session().post(_GEMINI_URL, json=data, timeout=_HTTP_TIMEOUT)
+    response.raise_for_status()
+    
+    result = response.json()
+    return result["candidates"][0]["content"]["parts"][0]["text"]
+
+def query_gemini_api(prompt, temperature=0.2):
+    """Consulta a API Gemini para geração de conteúdo."""
+    prompt_key = _prompt_cache_key(prompt, temperature, 2048)
+    
     with st.spinner("Processando com IA..."):
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            result = response.json()
-            try:
-                return result["candidates"][0]["content"]["parts"][0]["text"]
-            except (KeyError, IndexError) as e:
-                st.error(f"Erro ao processar resposta da API: {e}")
-                return None
+            return _gemini_generate(prompt_key, temperature, 2048, prompt)
+        except (KeyError, IndexError) as e:
+            st.error(f"Erro ao processar resposta da API: {e}")
+            return None
         except Exception as e:
             st.error(f"Erro na API Gemini: {str(e)}")
             return None
@@ -86,11 +116,10 @@ def extract_coordinates_from_text(text):
     if result:
         try:
             # Encontra o primeiro array JSON no texto
-            import re
-            json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
+            json_match = _JSON_ARRAY_RE.search(result)
             if json_match:
                 json_str = json_match.group(0)
-                coords = json.loads(json_str)
+                coords = orjson.loads(json_str)
                 return coords
             else:
                 st.warning("Formato de coordenadas não identificado na resposta.")
@@ -101,38 +130,72 @@ def extract_coordinates_from_text(text):
     return []
 
 # --------- FUNÇÕES DE PROCESSAMENTO GEOESPACIAL ---------
+# Layout dos pontos LiDAR simulados (um registro por ponto)
+# (especificações simples, sem depender do NumPy na importação do módulo)
+_LIDAR_DTYPE = [
+    ('X', 'f8'),
+    ('Y', 'f8'),
+    ('Z', 'f8'),
+    ('Intensity', 'u1'),
+    ('Classification', 'u1')
+]
+
+# Distribuição acumulada das classes LiDAR 1-5 (probabilidades 0.05, 0.7, 0.1, 0.1, 0.05);
+# o último valor é exatamente 1.0 para evitar erro de arredondamento
+_CLASS_CDF = (0.05, 0.75, 0.85, 0.95, 1.0)
+
+@st.cache_data(max_entries=32, ttl=3600, show_spinner=False)
 def generate_lidar_sample(center_lat, center_lon, radius=0.05, points=1000):
     """Gera uma amostra de dados LiDAR simulados ao redor de um ponto central."""
-    np.random.seed(42)  # Para reprodutibilidade
+    import numpy as np
+    import pandas as pd
+    
+    rng = np.random.default_rng(42)  # Gerador local, para reprodutibilidade
+    
+    # Um único bloco de memória com todos os campos do ponto
+    out = np.empty(points, dtype=_LIDAR_DTYPE)
     
     # Gerar pontos aleatórios dentro de um círculo
-    theta = np.random.uniform(0, 2*np.pi, points)
-    r = radius * np.sqrt(np.random.uniform(0, 1, points))
+    theta = rng.uniform(0, 2*np.pi, points)
+    r = radius * np.sqrt(rng.uniform(0, 1, points))
     
     # Converter para coordenadas cartesianas
-    x = center_lon + r * np.cos(theta)
-    y = center_lat + r * np.sin(theta)
+    out['X'] = center_lon + r * np.cos(theta)
+    out['Y'] = center_lat + r * np.sin(theta)
     
     # Gerar altitudes simuladas (valores Z) - em áreas de floresta, variam bastante
     # Base altitude + variação baseada em distância do centro + ruído
     base_altitude = 100  # metros acima do nível do mar
-    z = base_altitude + (1 - r/radius) * 50 + np.random.normal(0, 10, points)
+    out['Z'] = base_altitude + (1 - r/radius) * 50 + rng.normal(0, 10, points)
+    
+    out['Intensity'] = rng.integers(0, 255, points)
+    # Classes 1-5 sorteadas por busca binária na distribuição acumulada
+    out['Classification'] = np.searchsorted(_CLASS_CDF, rng.random(points), side='right') + 1
     
     # Retornar como DataFrame
-    return pd.DataFrame({
-        'X': x,
-        'Y': y,
-        'Z': z,
-        'Intensity': np.random.randint(0, 255, points),
-        'Classification': np.random.choice([1, 2, 3, 4, 5], points, p=[0.05, 0.7, 0.1, 0.1, 0.05])
-    })
+    return pd.DataFrame.from_records(out)
 
 def create_download_link(df, filename, link_text):
-    """Cria um link para download de um DataFrame como CSV."""
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">{link_text}</a>'
-    return href
+    """Cria um botão para download de um DataFrame como CSV."""
+    return st.download_button(
+        link_text,
+        data=df.to_csv(index=False).encode(),
+        file_name=filename,
+        mime="text/csv",
+        on_click="ignore"
+    )
+
+def create_parquet_download(df, filename, link_text):
+    """Cria um botão para download de um DataFrame como Parquet (zstd)."""
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, compression="zstd")
+    return st.download_button(
+        link_text,
+        data=buffer.getvalue(),
+        file_name=filename,
+        mime="application/vnd.apache.parquet",
+        on_click="ignore"
+    )
 
 def create_geojson_for_download(coordinates, filename="pontos_amazonia.geojson"):
     """Cria um GeoJSON para download a partir das coordenadas."""
@@ -153,18 +216,20 @@ def create_geojson_for_download(coordinates, filename="pontos_amazonia.geojson")
         ]
     }
     
-    # Converter para JSON string
-    geojson_str = json.dumps(geojson, indent=2)
-    
-    # Criar link para download
-    b64 = base64.b64encode(geojson_str.encode()).decode()
-    href = f'<a href="data:application/json;base64,{b64}" download="{filename}">{filename}</a>'
+    # Serializar de forma compacta (o QGIS não depende da indentação)
+    geojson_bytes = orjson.dumps(geojson)
     
-    return href
+    # Criar botão para download
+    return st.download_button(
+        filename,
+        data=geojson_bytes,
+        file_name=filename,
+        mime="application/geo+json",
+        on_click="ignore"
+    )
 
-def create_qml_style(style_type="ship"):
-    """Cria um arquivo de estilo QML para ícones."""
-    qml_content = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+# Estilo QML de caravela (estático), já codificado para download
+_QML_CONTENT = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <renderer-v2 forceraster="0" type="singleSymbol" symbollevels="0" enableorderby="0">
     <symbols>
@@ -195,11 +260,18 @@ def create_qml_style(style_type="ship"):
   </renderer-v2>
 </qgis>
 """
-    # Criar link para download
-    b64 = base64.b64encode(qml_content.encode()).decode()
-    href = f'<a href="data:text/xml;base64,{b64}" download="estilo_caravela.qml">estilo_caravela.qml</a>'
-    
-    return href
+_QML_BYTES = _QML_CONTENT.encode()
+
+def create_qml_style(style_type="ship"):
+    """Cria um arquivo de estilo QML para ícones."""
+    # Criar botão para download
+    return st.download_button(
+        "estilo_caravela.qml",
+        data=_QML_BYTES,
+        file_name="estilo_caravela.qml",
+        mime="text/xml",
+        on_click="ignore"
+    )
 
 # --------- INTERFACE DO APLICATIVO STREAMLIT ---------
 st.title("🌎 GAIA DIGITAL - Análise Geoespacial Amazônica")
@@ -227,6 +299,11 @@ with st.sidebar.expander("Configurações Avançadas"):
     
 # Botão para processar
 if st.button("Processar e Gerar Mapa"):
+    # pandas/NumPy só são usados após o clique: importá-los aqui evita
+    # pagar o custo de importação na primeira renderização da página
+    import pandas as pd
+    import numpy as np
+    
     # Extrair coordenadas do texto usando IA
     with st.spinner("Processando texto com IA para extrair coordenadas..."):
         coordinates = extract_coordinates_from_text(text_input)
@@ -245,14 +322,18 @@ if st.button("Processar e Gerar Mapa"):
     st.dataframe(coord_df)
     
     # Criar dados LiDAR simulados
-    center_lat = sum(c["lat"] for c in coordinates) / len(coordinates)
-    center_lon = sum(c["lon"] for c in coordinates) / len(coordinates)
+    latlon = np.fromiter(
+        ((c["lat"], c["lon"]) for c in coordinates),
+        dtype=np.dtype((np.float64, 2)), count=len(coordinates)
+    )
+    center_lat, center_lon = latlon.mean(axis=0).tolist()
     
     lidar_data = generate_lidar_sample(center_lat, center_lon, lidar_radius, lidar_density)
     
     # Visualizar amostra dos dados LiDAR
     st.subheader("Amostra de Dados LiDAR (Simulados)")
-    st.dataframe(lidar_data.head(10))
+    # Prévia estática: dez linhas não precisam da grade interativa
+    st.table(lidar_data.head(10))
     
     # Visualizar mapa usando OpenStreetMap incorporado em um iframe HTML
     st.subheader("Visualização do Mapa (OpenStreetMap)")
@@ -294,17 +375,16 @@ if st.button("Processar e Gerar Mapa"):
     # Seção de downloads
     st.subheader("Exportar para QGIS")
     
-    # Criar links de download
+    # Criar botões de download
     st.markdown("### Dados LiDAR")
-    st.markdown(create_download_link(lidar_data, "amazonia_lidar.csv", 
-                                   "⬇️ Download Dados LiDAR (CSV)"), unsafe_allow_html=True)
+    create_download_link(lidar_data, "amazonia_lidar.csv", "⬇️ Download Dados LiDAR (CSV)")
+    create_parquet_download(lidar_data, "amazonia_lidar.parquet", "⬇️ Download Dados LiDAR (Parquet)")
     
     st.markdown("### Pontos de Interesse (GeoJSON)")
-    st.markdown(create_geojson_for_download(coordinates, "pontos_amazonia.geojson"), 
-               unsafe_allow_html=True)
+    create_geojson_for_download(coordinates, "pontos_amazonia.geojson")
     
     st.markdown("### Estilo de Caravela para QGIS (QML)")
-    st.markdown(create_qml_style(), unsafe_allow_html=True)
+    create_qml_style()
     
     # Instruções para QGIS
     with st.expander("Como importar no QGIS"):
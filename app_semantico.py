@@ -1,14 +1,22 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import os
-import json
+import io
+import orjson
 import re
 import requests
+from requests.adapters import HTTPAdapter
 import base64
-import time
+import hashlib
+import zipfile
+from collections import Counter
 from datetime import datetime
 
+# Padrão para localizar o array JSON na resposta do modelo
+_JSON_ARRAY_RE = re.compile(r'\[\s*{.*}\s*\]', re.DOTALL)
+
+# Tempo limite (conexão, leitura) das requisições à API Gemini, em segundos
+_HTTP_TIMEOUT = (5, 60)
+_GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+
 # Configuração da página
 st.set_page_config(
     page_title="GAIA DIGITAL - Georreferenciamento Científico",
@@ -36,24 +44,46 @@ def get_secure_api_key():
     combined = "".join(encoded_parts)
     return base64.b64decode(combined).decode('utf-8')
 
-def query_gemini_api(prompt, temperature=0.1, max_tokens=2048):
+@st.cache_resource
+def _get_http_session():
     """
-    Consulta a API Gemini de forma segura com a chave ocultada.
+    Sessão HTTP compartilhada: reaproveita conexões TCP/TLS com a API Gemini
+    entre chamadas e entre execuções do script.
+    """
+    session = requests.Session()
+    # A chave vai no cabeçalho, fora da URL (não aparece em logs)
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'x-goog-api-key': get_secure_api_key()
+    })
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+def _prompt_cache_key(prompt, temperature, max_tokens):
+    """
+    Gera a chave de cache (SHA-256) de uma consulta à API Gemini.
+    O prompt é normalizado (espaços colapsados) antes do hash.
+    """
+    payload = orjson.dumps({
+        "prompt": " ".join(prompt.split()),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "model": "gemini-2.0-flash"
+    }, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _gemini_generate(prompt_key, temperature, max_tokens, _prompt):
+    """
+    Executa a chamada à API Gemini com resultado em cache por `prompt_key`.
+    Erros são propagados como exceção e, portanto, não ficam em cache.
     """
-    # Obter a chave API apenas quando necessário
-    api_key = get_secure_api_key()
-    
-    # Construir URL com a chave
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    url = f"{url}?key={api_key}"
-    
-    headers = {'Content-Type': 'application/json'}
     data = {
         "contents": [
             {
                 "parts": [
                     {
-                        "text": prompt
+                        "text": _prompt
                     }
                 ]
             }
@@ -64,22 +94,29 @@ def query_gemini_api(prompt, temperature=0.1, max_tokens=2048):
         }
     }
     
+    response = _get_http_session().post(_GEMINI_URL, json=data, timeout=_HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise requests.HTTPError(response=response)
+    
+    result = response.json()
+    return result["candidates"][0]["content"]["parts"][0]["text"]
+
+def query_gemini_api(prompt, temperature=0.1, max_tokens=2048):
+    """
+    Consulta a API Gemini de forma segura com a chave ocultada.
+    Respostas para prompts idênticos são reaproveitadas do cache.
+    """
+    prompt_key = _prompt_cache_key(prompt, temperature, max_tokens)
+    
     with st.spinner("Aplicando métodos geodésicos científicos..."):
         try:
-            response = requests.post(url, headers=headers, json=data)
-            
-            # Verificar resposta
-            if response.status_code == 200:
-                result = response.json()
-                try:
-                    return result["candidates"][0]["content"]["parts"][0]["text"]
-                except (KeyError, IndexError) as e:
-                    st.error(f"Erro ao processar resposta da API: {e}")
-                    return None
-            else:
-                st.error(f"Erro na API Gemini: {response.status_code}")
-                return None
-                
+            return _gemini_generate(prompt_key, temperature, max_tokens, prompt)
+        except requests.HTTPError as e:
+            st.error(f"Erro na API Gemini: {e.response.status_code}")
+            return None
+        except (KeyError, IndexError) as e:
+            st.error(f"Erro ao processar resposta da API: {e}")
+            return None
         except Exception as e:
             st.error(f"Erro ao comunicar com a API: {str(e)}")
             return None
@@ -196,12 +233,12 @@ def determine_geodetic_points_scientific(text, reference_points=REFERENCE_GEODET
     # Processar entidades identificadas
     try:
         # Extrair JSON
-        json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
+        json_match = _JSON_ARRAY_RE.search(result)
         if not json_match:
             return []
             
         json_str = json_match.group(0)
-        entities = json.loads(json_str)
+        entities = orjson.loads(json_str)
         
         # Agora realizar processo científico de determinação de coordenadas
         geodetic_points = []
@@ -373,8 +410,8 @@ def get_map_layers_html(center_lat, center_lon, zoom=10, geodetic_points=None, o
     """
     Gera HTML para múltiplas camadas de mapas com opacidade ajustável, incluindo pontos geodésicos científicos.
     """
-    # Preparar marcadores para os mapas
-    markers = ""
+    # Preparar marcadores para os mapas (montados em lista e unidos ao final)
+    marker_parts = []
     if geodetic_points:
         for p in geodetic_points:
             lat = p.get('lat', 0)
@@ -394,7 +431,7 @@ def get_map_layers_html(center_lat, center_lon, zoom=10, geodetic_points=None, o
                 icon = '📍'  # Pino padrão para outros
             
             # Adicionar marcador com popup científico
-            markers += f"""
+            marker_parts.append(f"""
             var marker = L.marker([{lat}, {lon}], {{
                 icon: L.divIcon({{
                     html: '<div style="font-size: 24px; text-align: center;">{icon}</div>',
@@ -406,7 +443,8 @@ def get_map_layers_html(center_lat, center_lon, zoom=10, geodetic_points=None, o
             }}).addTo(map);
             
             marker.bindPopup("<b>{nome}</b><br>{tipo}<br>Precisão: {precision:.2f}");
-            """
+            """)
+    markers = "".join(marker_parts)
     
     # OpenStreetMap base com marcadores
     osm_style = f"style='opacity: {opacity}; border: 1px solid black;'"
@@ -450,56 +488,12 @@ def get_map_layers_html(center_lat, center_lon, zoom=10, geodetic_points=None, o
         "hibrido": hybrid_map
     }
 
-def create_scientific_qgis_project(geodetic_points):
-    """
-    Cria um projeto QGIS cientificamente rigoroso com os pontos geodésicos.
-    
-    Args:
-        geodetic_points (list): Lista de pontos geodésicos validados
-        
-    Returns:
-        tuple: Links para download de arquivos e conteúdo GeoJSON
-    """
-    import io
-    import zipfile
-    
-    # 1. Criar GeoJSON com precisão científica
-    geojson = {
-        "type": "FeatureCollection",
-        "crs": {
-            "type": "name",
-            "properties": {
-                "name": "urn:ogc:def:crs:OGC:1.3:CRS84"
-            }
-        },
-        "features": []
-    }
-    
-    # Adicionar pontos ao GeoJSON
-    for point in geodetic_points:
-        feature = {
-            "type": "Feature",
-            "properties": {
-                "nome": point.get("nome", ""),
-                "tipo": point.get("tipo", ""),
-                "categoria": point.get("categoria", ""),
-                "precisao": point.get("precisao_geodesica", 0.5),
-                "fonte": point.get("fonte", ""),
-                "metodo": point.get("metodo", ""),
-                "validacao": point.get("validacao", "")
-            },
-            "geometry": {
-                "type": "Point",
-                "coordinates": [point.get("lon", 0), point.get("lat", 0)]
-            }
-        }
-        geojson["features"].append(feature)
-    
-    # Converter para string
-    geojson_str = json.dumps(geojson, indent=2)
-    
-    # 2. Criar estilo QML científico para pontos
-    scientific_qml = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+# --------- MODELOS DO PACOTE QGIS CIENTÍFICO ---------
+# Modelos estáticos mantidos no nível do módulo; apenas os campos dinâmicos
+# (extensão do mapa e datas) são preenchidos via str.format a cada pacote.
+
+# Estilo QML científico para pontos
+_SCIENTIFIC_QML = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <renderer-v2 forceraster="0" symbollevels="0" type="RuleRenderer" enableorderby="0">
     <rules key="{d26b5359-3e9c-4bb8-9e32-3d9c2e7aef3f}">
@@ -722,9 +716,9 @@ def create_scientific_qgis_project(geodetic_points):
   <layerGeometryType>0</layerGeometryType>
 </qgis>
 """
-    
-    # 3. Criar estilo de caravela
-    caravela_qml = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+
+# Estilo de caravela
+_CARAVELA_QML = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <renderer-v2 forceraster="0" type="singleSymbol" symbollevels="0" enableorderby="0">
     <symbols>
@@ -767,20 +761,9 @@ def create_scientific_qgis_project(geodetic_points):
   </renderer-v2>
 </qgis>
 """
-    
-    # 4. Calcular extensão do mapa a partir dos pontos
-    if geodetic_points:
-        min_lon = min(p.get("lon", 0) for p in geodetic_points) - 0.2
-        max_lon = max(p.get("lon", 0) for p in geodetic_points) + 0.2
-        min_lat = min(p.get("lat", 0) for p in geodetic_points) - 0.2
-        max_lat = max(p.get("lat", 0) for p in geodetic_points) + 0.2
-    else:
-        # Coordenadas padrão para a Amazônia Central
-        min_lon, max_lon = -61.0, -59.0
-        min_lat, max_lat = -4.0, -2.0
-        
-    # 5. Criar arquivo de projeto QGIS
-    qgis_project = f"""<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+
+# Projeto QGIS (campos: min_lon, min_lat, max_lon, max_lat, stamp_full)
+_QGIS_PROJECT_TMPL = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis projectname="Georreferenciamento Científico Amazônico" version="3.22.0-Białowieża">
   <title>Georreferenciamento Científico Amazônico</title>
   <projectCrs>
@@ -814,7 +797,7 @@ def create_scientific_qgis_project(geodetic_points):
   <projectMetadata>
     <author>GAIA DIGITAL - Geodésia Científica</author>
     <creation>
-      <datetime>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</datetime>
+      <datetime>{stamp_full}</datetime>
     </creation>
     <abstract>Projeto de georreferenciamento científico para a região amazônica</abstract>
     <keywords>
@@ -879,11 +862,11 @@ def create_scientific_qgis_project(geodetic_points):
   </projectlayers>
 </qgis>
 """
-    
-    # 6. Criar documentação científica
-    documentacao = f"""# Documentação Científica - Projeto de Georreferenciamento Amazônico
 
-**Data de criação:** {datetime.now().strftime('%Y-%m-%d')}
+# Documentação científica (campo: stamp_day)
+_DOCUMENTACAO_TMPL = """# Documentação Científica - Projeto de Georreferenciamento Amazônico
+
+**Data de criação:** {stamp_day}
 **Datum:** WGS 84 (EPSG:4326)
 **Sistema de coordenadas:** Geográficas (Latitude/Longitude)
 **Método de determinação:** Combinação de fontes oficiais e relações geoespaciais
@@ -925,33 +908,158 @@ Para utilização científica destes dados, observe:
 **Referência sugerida:**
 GAIA DIGITAL (2025). Georreferenciamento Científico Amazônico. Projeto de determinação geodésica precisa.
 """
+
+# Metadados científicos (campos: stamp_day, total_pontos, precisao_media)
+_METADADOS_TMPL = """
+METADADOS CIENTÍFICOS - GAIA DIGITAL
+Data de criação: {stamp_day}
+Total de pontos: {total_pontos}
+Datum: WGS 84 (EPSG:4326)
+Precisão média: {precisao_media:.4f}
+"""
+
+def create_scientific_qgis_project(geodetic_points):
+    """
+    Cria um projeto QGIS cientificamente rigoroso com os pontos geodésicos.
+    
+    Args:
+        geodetic_points (list): Lista de pontos geodésicos validados
+        
+    Returns:
+        tuple: Links para download de arquivos e conteúdo GeoJSON
+    """
+    # 1. Criar GeoJSON com precisão científica
+    geojson = {
+        "type": "FeatureCollection",
+        "crs": {
+            "type": "name",
+            "properties": {
+                "name": "urn:ogc:def:crs:OGC:1.3:CRS84"
+            }
+        },
+        "features": []
+    }
+    
+    # Adicionar pontos ao GeoJSON
+    for point in geodetic_points:
+        feature = {
+            "type": "Feature",
+            "properties": {
+                "nome": point.get("nome", ""),
+                "tipo": point.get("tipo", ""),
+                "categoria": point.get("categoria", ""),
+                "precisao": point.get("precisao_geodesica", 0.5),
+                "fonte": point.get("fonte", ""),
+                "metodo": point.get("metodo", ""),
+                "validacao": point.get("validacao", "")
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [point.get("lon", 0), point.get("lat", 0)]
+            }
+        }
+        geojson["features"].append(feature)
+    
+    # Serializar de forma compacta (o QGIS não depende da indentação)
+    geojson_bytes = orjson.dumps(geojson)
+    
+    # 2. Calcular extensão do mapa a partir dos pontos
+    if geodetic_points:
+        min_lon = min(p.get("lon", 0) for p in geodetic_points) - 0.2
+        max_lon = max(p.get("lon", 0) for p in geodetic_points) + 0.2
+        min_lat = min(p.get("lat", 0) for p in geodetic_points) - 0.2
+        max_lat = max(p.get("lat", 0) for p in geodetic_points) + 0.2
+    else:
+        # Coordenadas padrão para a Amazônia Central
+        min_lon, max_lon = -61.0, -59.0
+        min_lat, max_lat = -4.0, -2.0
+        
+    # Carimbo de data/hora único para todos os arquivos do pacote
+    now = datetime.now()
+    stamp_full = now.strftime('%Y-%m-%d %H:%M:%S')
+    stamp_day = now.strftime('%Y-%m-%d')
     
-    # 7. Criar arquivo ZIP com todo o pacote
+    # 3. Criar arquivo de projeto QGIS
+    qgis_project = _QGIS_PROJECT_TMPL.format(
+        min_lon=min_lon, min_lat=min_lat, max_lon=max_lon, max_lat=max_lat,
+        stamp_full=stamp_full
+    )
+    
+    # 4. Criar documentação científica e metadados
+    documentacao = _DOCUMENTACAO_TMPL.format(stamp_day=stamp_day)
+    avg_precision = (sum(p.get('precisao_geodesica', 0) for p in geodetic_points) / len(geodetic_points)
+                     if geodetic_points else 0)
+    metadados = _METADADOS_TMPL.format(
+        stamp_day=stamp_day, total_pontos=len(geodetic_points), precisao_media=avg_precision
+    )
+    
+    # 5. Criar arquivo ZIP com todo o pacote
     zip_buffer = io.BytesIO()
+    # Todos os membros usam o mesmo carimbo de data/hora, evitando uma
+    # chamada a time.localtime() por arquivo dentro de writestr
+    zip_date = now.timetuple()[:6]
+    members = (
+        ("georreferenciamento_cientifico.qgs", qgis_project),
+        ("pontos_geodesicos.geojson", geojson_bytes),
+        ("estilo_cientifico.qml", _SCIENTIFIC_QML),
+        ("estilo_caravela.qml", _CARAVELA_QML),
+        ("documentacao_cientifica.md", documentacao),
+        ("metadados_científicos.txt", metadados),
+    )
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr("georreferenciamento_cientifico.qgs", qgis_project)
-        zipf.writestr("pontos_geodesicos.geojson", geojson_str)
-        zipf.writestr("estilo_cientifico.qml", scientific_qml)
-        zipf.writestr("estilo_caravela.qml", caravela_qml)
-        zipf.writestr("documentacao_cientifica.md", documentacao)
-        zipf.writestr("metadados_científicos.txt", f"""
-METADADOS CIENTÍFICOS - GAIA DIGITAL
-Data de criação: {datetime.now().strftime('%Y-%m-%d')}
-Total de pontos: {len(geodetic_points)}
-Datum: WGS 84 (EPSG:4326)
-Precisão média: {sum(p.get('precisao_geodesica', 0) for p in geodetic_points) / len(geodetic_points) if geodetic_points else 0:.4f}
-""")
+        for name, data in members:
+            zinfo = zipfile.ZipInfo(name, zip_date)
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.external_attr = 0o644 << 16  # Permissões -rw-r--r--
+            zipf.writestr(zinfo, data)
     
-    # 8. Criar link para download
+    # 6. Criar link para download
     zip_buffer.seek(0)
     b64 = base64.b64encode(zip_buffer.read()).decode()
     zip_href = f'<a href="data:application/zip;base64,{b64}" download="georreferenciamento_cientifico.zip">⬇️ Download do Projeto Científico Completo</a>'
     
-    # 9. Criar link GeoJSON separado
-    geojson_b64 = base64.b64encode(geojson_str.encode()).decode()
+    # 7. Criar link GeoJSON separado
+    geojson_b64 = base64.b64encode(geojson_bytes).decode()
     geojson_href = f'<a href="data:application/json;base64,{geojson_b64}" download="pontos_geodesicos.geojson">⬇️ Download Pontos Geodésicos (GeoJSON)</a>'
     
-    return zip_href, geojson_href, geojson_str
+    return zip_href, geojson_href, geojson_bytes.decode()
+
+def get_scientific_analysis(points_key):
+    """
+    Gera a análise científica detalhada da região a partir dos pontos geodésicos.
+    
+    Reexecuções do Streamlit com os mesmos pontos geram o mesmo prompt, cuja
+    resposta bem-sucedida é reaproveitada do cache de _gemini_generate; falhas
+    não são armazenadas.
+    
+    Args:
+        points_key (tuple): Tuplas (nome, tipo, categoria, lat, lon, precisao) de cada ponto
+        
+    Returns:
+        str: Texto da análise ou None em caso de erro
+    """
+    points = [
+        {"nome": nome, "tipo": tipo, "categoria": categoria, "lat": lat, "lon": lon, "precisao": precisao}
+        for nome, tipo, categoria, lat, lon, precisao in points_key
+    ]
+    
+    prompt = f"""
+    Forneça uma análise científica rigorosa da região amazônica descrita, com foco em:
+    
+    1. Caracterização geomorfológica precisa
+    2. Análise hidrográfica com terminologia técnica
+    3. Avaliação de padrões de uso e ocupação do solo
+    4. Aspectos relevantes para pesquisa científica
+    
+    Use linguagem técnica apropriada para relatórios científicos.
+    Base sua análise nos seguintes pontos geodésicos identificados:
+    
+    {orjson.dumps(points, option=orjson.OPT_INDENT_2).decode()}
+    
+    Inclua coordenadas precisas quando relevante.
+    """
+    
+    return query_gemini_api(prompt, temperature=0.1)
 
 # --------- INTERFACE DO APLICATIVO STREAMLIT ---------
 st.title("🧭 GAIA DIGITAL - Georreferenciamento Científico Amazônico")
@@ -1000,13 +1108,22 @@ with st.sidebar.expander("Configurações Científicas"):
     
 # Botão para processar
 if st.button("Processar com Método Científico"):
+    # pandas/NumPy só são usados após o clique: importá-los aqui evita
+    # pagar o custo de importação na primeira renderização da página
+    import pandas as pd
+    import numpy as np
+    
     # Determinar pontos geodésicos usando método científico
     with st.spinner("Aplicando metodologia científica de georreferenciamento..."):
         geodetic_points = determine_geodetic_points_scientific(text_input)
         
-        # Filtrar por precisão geodésica
+        # Filtrar por precisão geodésica e ordenar (mais precisos primeiro)
+        # em um único pipeline pandas
         if geodetic_points:
-            geodetic_points = [p for p in geodetic_points if p.get('precisao_geodesica', 0) >= precision_threshold]
+            points_df = pd.DataFrame(geodetic_points)
+            points_df = points_df[points_df["precisao_geodesica"] >= precision_threshold]
+            points_df = points_df.sort_values("precisao_geodesica", ascending=False, ignore_index=True)
+            geodetic_points = points_df.fillna({"validacao": ""}).to_dict("records")
             
         if not geodetic_points:
             st.error("Não foi possível determinar pontos geodésicos com o nível de precisão solicitado.")
@@ -1016,40 +1133,46 @@ if st.button("Processar com Método Científico"):
         # Exibir pontos geodésicos identificados
         st.subheader("Pontos Geodésicos Determinados por Método Científico")
         
-        # Criar DataFrame para exibição
-        geodetic_df = pd.DataFrame([
-            {
-                "Nome": p['nome'],
-                "Tipo": p['tipo'],
-                "Categoria": p['categoria'],
-                "Latitude": f"{p['lat']:.6f}",
-                "Longitude": f"{p['lon']:.6f}",
-                "Precisão": f"{p['precisao_geodesica']:.4f}",
-                "Método": p['metodo'],
-                "Validação": p.get('validacao', '')
-            } for p in geodetic_points
-        ])
+        # Criar DataFrame para exibição (colunas numéricas formatadas pelo frontend)
+        geodetic_df = pd.DataFrame(geodetic_points).reindex(columns=[
+            "nome", "tipo", "categoria", "lat", "lon", "precisao_geodesica", "metodo", "validacao"
+        ]).rename(columns={
+            "nome": "Nome",
+            "tipo": "Tipo",
+            "categoria": "Categoria",
+            "lat": "Latitude",
+            "lon": "Longitude",
+            "precisao_geodesica": "Precisão",
+            "metodo": "Método",
+            "validacao": "Validação"
+        })
         
         # Exibir em formato tabular científico
-        st.dataframe(geodetic_df)
+        st.dataframe(geodetic_df, column_config={
+            "Latitude": st.column_config.NumberColumn(format="%.6f"),
+            "Longitude": st.column_config.NumberColumn(format="%.6f"),
+            "Precisão": st.column_config.NumberColumn(format="%.4f")
+        })
         
         # Determinar centro do mapa e obter camadas
-        center_lat = sum(p.get("lat", 0) for p in geodetic_points) / len(geodetic_points)
-        center_lon = sum(p.get("lon", 0) for p in geodetic_points) / len(geodetic_points)
+        latlon = np.fromiter(
+            ((p.get("lat", 0), p.get("lon", 0)) for p in geodetic_points),
+            dtype=np.dtype((np.float64, 2)), count=len(geodetic_points)
+        )
+        center_lat, center_lon = latlon.mean(axis=0).tolist()
         
         # Obter HTML para diferentes tipos de mapas
         map_layers = get_map_layers_html(center_lat, center_lon, map_zoom, geodetic_points, map_opacity)
         
         # Exibir mapas conforme seleção do usuário
         if view_option == "Todos":
-            st.subheader("Mapa Base (OpenStreetMap)")
-            st.markdown(map_layers["base"], unsafe_allow_html=True)
-            
-            st.subheader("Mapa Topográfico")
-            st.markdown(map_layers["topografico"], unsafe_allow_html=True)
-            
-            st.subheader("Mapa Híbrido")
-            st.markdown(map_layers["hibrido"], unsafe_allow_html=True)
+            # Renderizar os três mapas em uma única mensagem para o frontend
+            combined = "\n".join([
+                "<h3>Mapa Base (OpenStreetMap)</h3>", map_layers["base"],
+                "<h3>Mapa Topográfico</h3>", map_layers["topografico"],
+                "<h3>Mapa Híbrido</h3>", map_layers["hibrido"],
+            ])
+            st.markdown(combined, unsafe_allow_html=True)
         else:
             map_type = view_option.lower()
             map_titles = {
@@ -1067,11 +1190,12 @@ if st.button("Processar com Método Científico"):
         # Estatísticas científicas
         st.subheader("Análise Estatística de Precisão")
         
-        # Calcular métricas científicas
-        avg_precision = sum(p.get('precisao_geodesica', 0) for p in geodetic_points) / len(geodetic_points)
-        min_precision = min(p.get('precisao_geodesica', 0) for p in geodetic_points)
-        max_precision = max(p.get('precisao_geodesica', 0) for p in geodetic_points)
-        std_precision = np.std([p.get('precisao_geodesica', 0) for p in geodetic_points])
+        # Calcular métricas científicas a partir da coluna NumPy de precisão
+        precision = geodetic_df["Precisão"].to_numpy(dtype=np.float64)
+        avg_precision = precision.mean()
+        min_precision = precision.min()
+        max_precision = precision.max()
+        std_precision = precision.std()
         
         # Exibir métricas em forma tabular
         col1, col2, col3, col4 = st.columns(4)
@@ -1081,11 +1205,9 @@ if st.button("Processar com Método Científico"):
         col4.metric("Desvio Padrão", f"{std_precision:.4f}")
         
         # Distribuição de categorias
-        category_counts = {}
-        for point in geodetic_points:
-            cat = point.get('categoria', '').capitalize()
-            if cat:
-                category_counts[cat] = category_counts.get(cat, 0) + 1
+        category_counts = Counter(
+            cat for cat in (p.get('categoria', '').capitalize() for p in geodetic_points) if cat
+        )
         
         # Exibir estatísticas de categoria
         st.subheader("Distribuição de Categorias Geográficas")
@@ -1154,30 +1276,11 @@ if st.button("Processar com Método Científico"):
             
         # Análise científica detalhada
         with st.expander("Análise Científica Detalhada"):
-            prompt = f"""
-            Forneça uma análise científica rigorosa da região amazônica descrita, com foco em:
-            
-            1. Caracterização geomorfológica precisa
-            2. Análise hidrográfica com terminologia técnica
-            3. Avaliação de padrões de uso e ocupação do solo
-            4. Aspectos relevantes para pesquisa científica
-            
-            Use linguagem técnica apropriada para relatórios científicos.
-            Base sua análise nos seguintes pontos geodésicos identificados:
-            
-            {json.dumps([{
-                "nome": p['nome'],
-                "tipo": p['tipo'],
-                "categoria": p['categoria'],
-                "lat": p['lat'],
-                "lon": p['lon'],
-                "precisao": p['precisao_geodesica']
-            } for p in geodetic_points], indent=2)}
-            
-            Inclua coordenadas precisas quando relevante.
-            """
-            
-            analysis = query_gemini_api(prompt, temperature=0.1)
+            analysis_key = tuple(
+                (p['nome'], p['tipo'], p['categoria'], p['lat'], p['lon'], p['precisao_geodesica'])
+                for p in geodetic_points
+            )
+            analysis = get_scientific_analysis(analysis_key)
             if analysis:
                 st.markdown(analysis)
 
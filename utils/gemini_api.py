@@ -1,12 +1,28 @@
 import os
-import json
+import re
+import orjson
+import time
 import base64
+import hashlib
+import functools
+import logging
+import threading
+import unicodedata
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+_LOG = logging.getLogger(__name__)
+
+# Padrões para localizar JSON (array ou objeto) nas respostas do modelo
+_JSON_ARRAY_RE = re.compile(r'\[\s*{.*}\s*\]', re.DOTALL)
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 def get_gemini_api_key():
     """
     Obtém a chave da API Gemini de forma segura, seguindo esta ordem:
@@ -30,23 +46,209 @@ def get_gemini_api_key():
     
     return api_key
 
-def query_gemini_api(prompt, temperature=0.2, max_tokens=2048):
+# --------- CACHE DE RESPOSTAS ---------
+GEMINI_MODEL = "gemini-2.0-flash"
+
+class ExactMatchCache:
     """
-    Consulta a API Gemini para geração de conteúdo.
+    Cache em memória para respostas idênticas da API Gemini.
+    
+    A chave é o SHA-256 do prompt normalizado junto com os parâmetros de
+    geração; entradas expiram após `ttl` segundos e, ao atingir
+    `max_entries`, a menos usada recentemente é descartada. O acesso é
+    protegido por lock (usado pelas threads de query_gemini_api_many).
+    """
+    
+    def __init__(self, ttl=3600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(prompt, temperature, max_tokens, model=GEMINI_MODEL):
+        """
+        Gera a chave de cache para uma consulta.
+        
+        Args:
+            prompt (str): Prompt enviado à API (espaços são normalizados)
+            temperature (float): Temperatura da geração
+            max_tokens (int): Limite de tokens da resposta
+            model (str): Nome do modelo Gemini
+            
+        Returns:
+            str: Hash hexadecimal SHA-256
+        """
+        payload = orjson.dumps({
+            "prompt": " ".join(prompt.split()),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "model": model
+        }, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()
+    
+    def get(self, key):
+        """Retorna o valor em cache para a chave, ou None se ausente/expirado."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                return None
+            # Reinsere no final para manter a ordem de uso (LRU)
+            self._entries[key] = entry
+            return value
+    
+    def set(self, key, value):
+        """Armazena um valor, descartando a entrada mais antiga se necessário."""
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic(), value)
+
+_response_cache = ExactMatchCache()
+
+# --------- CLIENTE HTTP ---------
+# Sessão compartilhada: reaproveita conexões TCP/TLS entre chamadas.
+# O pool comporta as requisições simultâneas de query_gemini_api_many.
+_HTTP_TIMEOUT = (5, 60)  # (conexão, leitura) em segundos
+_GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+_GEMINI_STREAM_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+
+@functools.lru_cache(maxsize=None)
+def _get_session():
+    """Sessão criada no primeiro uso (importar o módulo não resolve a chave)."""
+    session = requests.Session()
+    session.headers.update({'Content-Type': 'application/json'})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+def _auth_headers():
+    """Cabeçalho com a chave da API: vai em x-goog-api-key, fora da URL (não aparece em logs)."""
+    return {'x-goog-api-key': get_gemini_api_key()}
+
+# Palavras que mudam a posição descrita sem mudar muito o embedding
+_DIRECTION_WORDS = frozenset({
+    "norte", "sul", "leste", "oeste", "nordeste", "noroeste", "sudeste", "sudoeste",
+    "acima", "abaixo", "montante", "jusante", "esquerda", "direita", "dentro", "fora"
+})
+_SIGNATURE_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|\w+")
+
+def geo_signature(text):
+    """
+    Assinatura de um texto geográfico: números, palavras de direção e nomes
+    próprios (palavras iniciadas em maiúscula), na ordem em que aparecem.
+    
+    Textos parafraseados só compartilham coordenadas se a assinatura for
+    idêntica: "norte de Manaus" e "sul de Manaus", ou "km 12" e "km 120",
+    são quase iguais para o embedding mas descrevem locais diferentes.
     
     Args:
-        prompt (str): O prompt textual para enviar à API
-        temperature (float): Controla aleatoriedade (0.0 a 1.0)
-        max_tokens (int): Número máximo de tokens na resposta
+        text (str): Texto de entrada
         
     Returns:
-        str: Texto gerado ou None em caso de erro
+        tuple: Tokens normalizados (minúsculas, sem acentos)
+    """
+    signature = []
+    for token in _SIGNATURE_TOKEN_RE.findall(unicodedata.normalize("NFC", text)):
+        folded = "".join(
+            ch for ch in unicodedata.normalize("NFKD", token.lower()) if not unicodedata.combining(ch)
+        )
+        if token[0].isdigit() or token[0].isupper() or folded in _DIRECTION_WORDS:
+            signature.append(folded.replace(",", "."))
+    return tuple(signature)
+
+class SemanticCache:
     """
-    api_key = get_gemini_api_key()
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
+    Cache semântico: reaproveita resultados de textos parafraseados.
     
-    headers = {'Content-Type': 'application/json'}
-    data = {
+    Cada texto é convertido em um embedding normalizado (modelo
+    sentence-transformers `all-MiniLM-L6-v2`); em uma consulta, a similaridade
+    de cosseno com todas as entradas é obtida por um único produto
+    matriz-vetor e, acima de `threshold`, o resultado armazenado é devolvido
+    desde que a assinatura do texto (`signature_fn`, por padrão geo_signature)
+    seja idêntica à da entrada. Se `sentence-transformers` não estiver instalado, o cache fica desativado
+    e as chamadas seguem direto para a função original.
+    """
+    
+    def __init__(self, model_name="all-MiniLM-L6-v2", threshold=0.92, max_entries=1024,
+                 signature_fn=geo_signature):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.signature_fn = signature_fn
+        self._model = None
+        self._enabled = True
+        self._embeddings = None
+        self._signatures = []
+        self._values = []
+    
+    def _encode(self, text):
+        """Retorna o embedding normalizado do texto, ou None se indisponível."""
+        if not self._enabled:
+            return None
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                _LOG.warning("sentence-transformers não instalado; cache semântico desativado.")
+                self._enabled = False
+                return None
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+    
+    def get_or_set(self, text, compute_fn):
+        """
+        Retorna o resultado em cache para um texto semelhante ou calcula-o.
+        
+        Args:
+            text (str): Texto de entrada
+            compute_fn (callable): Função chamada com `text` em caso de falta
+            
+        Returns:
+            Resultado em cache ou o retorno de `compute_fn(text)`
+        """
+        query = self._encode(text)
+        if query is None:
+            return compute_fn(text)
+        
+        signature = self.signature_fn(text)
+        if self._embeddings is not None:
+            # Embeddings normalizados: o produto escalar é a similaridade de cosseno
+            sims = self._embeddings @ query
+            candidates = np.flatnonzero(sims >= self.threshold)
+            # Mais semelhante primeiro, entre as entradas com a mesma assinatura
+            for i in candidates[np.argsort(-sims[candidates])]:
+                if self._signatures[i] == signature:
+                    return self._values[i]
+        
+        value = compute_fn(text)
+        # Resultados vazios indicam falha da API e não são armazenados
+        if value:
+            self._add(query, signature, value)
+        return value
+    
+    def _add(self, embedding, signature, value):
+        """Acrescenta uma entrada, descartando a mais antiga se necessário."""
+        if self._embeddings is None:
+            self._embeddings = embedding[np.newaxis, :]
+        else:
+            # Mantém as `keep` entradas mais recentes (slice explícito: [-0:] seria tudo)
+            keep = max(self.max_entries - 1, 0)
+            start = max(len(self._values) - keep, 0)
+            self._embeddings = np.vstack((self._embeddings[start:], embedding))
+            self._signatures = self._signatures[start:]
+            self._values = self._values[start:]
+        self._signatures.append(signature)
+        self._values.append(value)
+
+_semantic_cache = SemanticCache()
+
+def _request_body(prompt, temperature, max_tokens):
+    """Monta o corpo JSON de uma requisição generateContent."""
+    return {
         "contents": [
             {
                 "parts": [
@@ -61,26 +263,206 @@ def query_gemini_api(prompt, temperature=0.2, max_tokens=2048):
             "maxOutputTokens": max_tokens
         }
     }
+
+def query_gemini_api(prompt, temperature=0.2, max_tokens=2048):
+    """
+    Consulta a API Gemini para geração de conteúdo.
+    
+    Args:
+        prompt (str): O prompt textual para enviar à API
+        temperature (float): Controla aleatoriedade (0.0 a 1.0)
+        max_tokens (int): Número máximo de tokens na resposta
+        
+    Returns:
+        str: Texto gerado ou None em caso de erro
+    """
+    # Consultas idênticas são respondidas pelo cache, sem nova requisição
+    cache_key = ExactMatchCache.make_key(prompt, temperature, max_tokens)
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    data = _request_body(prompt, temperature, max_tokens)
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = _get_session().post(_GEMINI_URL, headers=_auth_headers(), json=data, timeout=_HTTP_TIMEOUT)
         response.raise_for_status()  # Lança exceção para códigos de erro HTTP
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         try:
-            return result["candidates"][0]["content"]["parts"][0]["text"]
+            text = result["candidates"][0]["content"]["parts"][0]["text"]
         except (KeyError, IndexError) as e:
             print(f"Erro ao processar resposta da API: {e}")
             return None
+        
+        _response_cache.set(cache_key, text)
+        return text
             
     except requests.exceptions.RequestException as e:
         print(f"Erro na requisição à API Gemini: {e}")
         return None
+    except orjson.JSONDecodeError as e:
+        print(f"Erro ao processar resposta da API: {e}")
+        return None
+
+class JSONArrayScanner:
+    """
+    Localiza de forma incremental o primeiro array JSON completo em um texto
+    recebido em partes (por exemplo, durante streaming).
+    
+    O array começa no primeiro `[` seguido (após espaços) de `{`, como em
+    _JSON_ARRAY_RE, de modo que texto entre colchetes antes do JSON é ignorado.
+    Só os caracteres estruturais são visitados; a profundidade de colchetes e
+    chaves é mantida entre chamadas, ignorando os que aparecem dentro de strings.
+    """
+    
+    _TOKEN_RE = re.compile(r'[\[\]{}"\\]')
+    _START_RE = re.compile(r'\[\s*\{')
+    # '[' no fim do buffer: o '{' que confirma o início pode vir no próximo trecho
+    _PENDING_START_RE = re.compile(r'\[\s*\Z')
+    
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._skip = -1
+    
+    def feed(self, chunk):
+        """
+        Acrescenta um trecho de texto ao buffer.
+        
+        Args:
+            chunk (str): Novo trecho recebido
+            
+        Returns:
+            str: O array JSON completo assim que for fechado, ou None
+        """
+        self._text += chunk
+        if self._start is None:
+            start = self._START_RE.search(self._text, self._pos)
+            if start is None:
+                pending = self._PENDING_START_RE.search(self._text, self._pos)
+                self._pos = pending.start() if pending else len(self._text)
+                return None
+            self._start = start.start()
+            self._depth = 1
+            self._pos = self._start + 1
+        for match in self._TOKEN_RE.finditer(self._text, self._pos):
+            i = match.start()
+            ch = match.group()
+            if i == self._skip:
+                continue
+            if self._in_string:
+                if ch == '\\':
+                    self._skip = i + 1  # caractere escapado
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '[{':
+                self._depth += 1
+            elif ch in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    return self._text[self._start:i + 1]
+        self._pos = len(self._text)
+        return None
+
+def stream_gemini_api(prompt, temperature=0.2, max_tokens=2048):
+    """
+    Consulta a API Gemini em modo streaming (SSE), produzindo o texto em partes.
+    
+    Args:
+        prompt (str): O prompt textual para enviar à API
+        temperature (float): Controla aleatoriedade (0.0 a 1.0)
+        max_tokens (int): Número máximo de tokens na resposta
+        
+    Yields:
+        str: Trechos de texto à medida que chegam
+    """
+    data = _request_body(prompt, temperature, max_tokens)
+    with _get_session().post(_GEMINI_STREAM_URL, headers=_auth_headers(), json=data,
+                             timeout=_HTTP_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            # Cada evento SSE traz um objeto GenerateContentResponse parcial
+            if not line.startswith(b"data:"):
+                continue
+            event = orjson.loads(line[5:])
+            for candidate in event.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if "text" in part:
+                        yield part["text"]
+
+def query_gemini_json_array(prompt, temperature=0.2, max_tokens=2048):
+    """
+    Consulta a API Gemini em streaming e retorna o primeiro array JSON da
+    resposta assim que ele se fecha, sem aguardar o fim da geração.
+    
+    Args:
+        prompt (str): O prompt textual para enviar à API
+        temperature (float): Controla aleatoriedade (0.0 a 1.0)
+        max_tokens (int): Número máximo de tokens na resposta
+        
+    Returns:
+        str: Texto do array JSON ou None em caso de erro
+    """
+    cache_key = ExactMatchCache.make_key(prompt, temperature, max_tokens)
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    scanner = JSONArrayScanner()
+    try:
+        for chunk in stream_gemini_api(prompt, temperature, max_tokens):
+            array_text = scanner.feed(chunk)
+            if array_text is not None:
+                _response_cache.set(cache_key, array_text)
+                return array_text
+    except requests.exceptions.RequestException as e:
+        print(f"Erro na requisição à API Gemini: {e}")
+        return None
+    except orjson.JSONDecodeError as e:
+        print(f"Erro ao processar resposta da API: {e}")
+        return None
+    
+    print("Array JSON não encontrado na resposta.")
+    return None
+
+def query_gemini_api_many(prompts, temperature=0.2, max_tokens=2048, max_workers=8):
+    """
+    Consulta a API Gemini para vários prompts independentes em paralelo.
+    
+    As chamadas são limitadas pela rede, então threads permitem que as
+    requisições se sobreponham: o tempo total fica próximo da chamada mais
+    lenta, e não da soma de todas.
+    
+    Args:
+        prompts (list): Lista de prompts textuais
+        temperature (float): Controla aleatoriedade (0.0 a 1.0)
+        max_tokens (int): Número máximo de tokens em cada resposta
+        max_workers (int): Número máximo de requisições simultâneas
+        
+    Returns:
+        list: Textos gerados na mesma ordem dos prompts (None em caso de erro)
+    """
+    if not prompts:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts))) as executor:
+        return list(executor.map(
+            lambda prompt: query_gemini_api(prompt, temperature, max_tokens),
+            prompts
+        ))
 
 def extract_coordinates_from_text(text):
     """
     Utiliza a API Gemini para extrair coordenadas geográficas de um texto.
+    Textos semanticamente equivalentes a uma consulta anterior reutilizam
+    o resultado do cache semântico.
     
     Args:
         text (str): Texto contendo descrições de locais
@@ -88,6 +470,10 @@ def extract_coordinates_from_text(text):
     Returns:
         list: Lista de dicionários com coordenadas extraídas
     """
+    return _semantic_cache.get_or_set(text, _extract_coordinates_uncached)
+
+def _extract_coordinates_uncached(text):
+    """Extrai coordenadas do texto consultando a API Gemini."""
     prompt = f"""
     Analise o seguinte texto e extraia todas as coordenadas geográficas mencionadas.
     Retorne APENAS um array JSON no formato:
@@ -106,20 +492,13 @@ def extract_coordinates_from_text(text):
     Texto: {text}
     """
     
-    result = query_gemini_api(prompt, temperature=0.1)
+    # O array é devolvido assim que se fecha no streaming
+    result = query_gemini_json_array(prompt, temperature=0.1)
     
     if result:
         try:
-            # Encontra o primeiro array JSON no texto
-            import re
-            json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                coords = json.loads(json_str)
-                return coords
-            else:
-                print("Formato de coordenadas não identificado na resposta.")
-                return []
+            # query_gemini_json_array já devolve apenas o texto do array
+            return orjson.loads(result)
         except Exception as e:
             print(f"Erro ao processar coordenadas: {e}")
             return []
@@ -155,6 +534,61 @@ def generate_geo_analysis(region_text, coordinates):
     
     return query_gemini_api(prompt, temperature=0.3, max_tokens=4096)
 
+def batch_analyze(coordinates, batch_size=20, temperature=0.2):
+    """
+    Gera uma análise curta para cada ponto, agrupando vários pontos por prompt.
+    
+    Os pontos são divididos em lotes de `batch_size`; cada lote vai em um único
+    prompt numerado, com a instrução de responder com um array JSON do mesmo
+    tamanho e na mesma ordem. Os lotes são enviados em paralelo.
+    
+    Args:
+        coordinates (list): Lista de coordenadas extraídas
+        batch_size (int): Número de pontos por prompt
+        temperature (float): Controla aleatoriedade (0.0 a 1.0)
+        
+    Returns:
+        list: Um dicionário de análise por ponto, na ordem de entrada
+              (None para pontos cujo lote falhou)
+    """
+    batches = [coordinates[i:i + batch_size] for i in range(0, len(coordinates), batch_size)]
+    prompts = []
+    for batch in batches:
+        rows = "\n".join(
+            f"{n}. {orjson.dumps(c).decode()}" for n, c in enumerate(batch, 1)
+        )
+        prompts.append(f"""
+    Para cada um dos {len(batch)} locais amazônicos numerados abaixo, forneça uma análise curta.
+    
+    {rows}
+    
+    Responda APENAS com um array JSON de exatamente {len(batch)} objetos, na mesma ordem:
+    [
+        {{
+            "ambiente": "<tipo de ambiente predominante>",
+            "riscos": "<principais riscos ambientais>",
+            "prioridade_lidar": "<alta, média ou baixa>"
+        }}
+    ]
+    """)
+    
+    results = []
+    for batch, response in zip(batches, query_gemini_api_many(prompts, temperature)):
+        analyses = []
+        if response:
+            json_match = _JSON_ARRAY_RE.search(response)
+            if json_match:
+                try:
+                    analyses = orjson.loads(json_match.group(0))
+                except ValueError as e:
+                    print(f"Erro ao processar análise em lote: {e}")
+        if len(analyses) != len(batch):
+            print("Tamanho da resposta difere do lote; pontos sem análise.")
+            analyses = analyses[:len(batch)] + [None] * (len(batch) - len(analyses))
+        results.extend(analyses)
+    
+    return results
+
 def generate_lidar_sampling_strategy(region_text, coordinates):
     """
     Gera uma estratégia de amostragem LiDAR personalizada para a região.
@@ -172,7 +606,7 @@ def generate_lidar_sampling_strategy(region_text, coordinates):
     
     Região: {region_text}
     
-    Coordenadas: {json.dumps(coordinates)}
+    Coordenadas: {orjson.dumps(coordinates).decode()}
     
     Responda APENAS com um JSON no seguinte formato:
     {{
@@ -189,11 +623,10 @@ def generate_lidar_sampling_strategy(region_text, coordinates):
     if result:
         try:
             # Encontra e extrai o objeto JSON
-            import re
-            json_match = re.search(r'{.*}', result, re.DOTALL)
+            json_match = _JSON_OBJ_RE.search(result)
             if json_match:
                 json_str = json_match.group(0)
-                strategy = json.loads(json_str)
+                strategy = orjson.loads(json_str)
                 return strategy
             else:
                 print("Formato de estratégia não identificado na resposta.")
@@ -1,11 +1,80 @@
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-from shapely.geometry import Point, Polygon, LineString
+import shapely
+from shapely.geometry import Point, Polygon
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import rasterio
 from rasterio.transform import from_origin
+from contourpy import contour_generator, LineType
+import functools
+from dataclasses import dataclass
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+@dataclass(frozen=True, slots=True)
+class LidarPoints:
+    """
+    Nuvem de pontos LiDAR como estrutura de arrays (um array NumPy contíguo
+    por atributo), consumida diretamente pelas funções de rasterização.
+    
+    Attributes:
+        x (np.ndarray): Coordenadas X (longitude)
+        y (np.ndarray): Coordenadas Y (latitude)
+        z (np.ndarray): Altitudes em metros
+        intensity (np.ndarray): Intensidade do retorno
+        classification (np.ndarray): Código de classificação do terreno
+        returns (np.ndarray): Número de retornos por pulso
+    """
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+    intensity: np.ndarray
+    classification: np.ndarray
+    returns: np.ndarray
+    
+    # Nome da coluna no DataFrame/CSV -> campo da estrutura
+    _COLUMNS = {
+        'X': 'x',
+        'Y': 'y',
+        'Z': 'z',
+        'Intensity': 'intensity',
+        'Classification': 'classification',
+        'ReturnNumber': 'returns',
+    }
+    
+    def __post_init__(self):
+        # Garantir arrays contíguos em ordem C (dataclass congelada)
+        for field in self._COLUMNS.values():
+            object.__setattr__(self, field, np.ascontiguousarray(getattr(self, field)))
+    
+    def __len__(self):
+        return len(self.x)
+    
+    def column(self, name):
+        """Retorna o array correspondente ao nome de coluna do DataFrame ('Z', 'Intensity', ...)."""
+        return getattr(self, self._COLUMNS[name])
+    
+    def to_dataframe(self):
+        """Converte para o DataFrame com as colunas X, Y, Z, Intensity, Classification e ReturnNumber."""
+        return pd.DataFrame({name: getattr(self, field) for name, field in self._COLUMNS.items()})
+
+def _column_array(lidar_data, name, dtype=None):
+    """Extrai uma coluna de LidarPoints ou de um DataFrame como array NumPy."""
+    if isinstance(lidar_data, LidarPoints):
+        return np.asarray(lidar_data.column(name), dtype=dtype)
+    return lidar_data[name].to_numpy(dtype=dtype)
+
+# Parâmetros de simulação por classe, indexados pelo código de classificação
+# (0: não usado, 1: floresta, 2: água, 3: vegetação baixa, 4: solo, 5: construções)
+_CLASS_TERRAIN_OFFSET = np.array([0.0, 0.0, -5.0, 0.0, 0.0, 0.0])   # Água fica abaixo da base
+_CLASS_TERRAIN_SIGMA = np.array([0.0, 5.0, 0.5, 3.0, 2.0, 1.0])     # Desvio do terreno (m)
+_CLASS_HEIGHT_SHAPE = np.array([0.0, 9.0, 0.0, 2.0, 0.0, 3.0])      # Gama: árvores ~36m,
+_CLASS_HEIGHT_SCALE = np.array([0.0, 4.0, 0.0, 1.5, 0.0, 2.0])      # vegetação ~3m, construções ~6m
+_CLASS_INTENSITY_LOW = np.array([0, 40, 5, 50, 120, 150])
+_CLASS_INTENSITY_HIGH = np.array([1, 120, 30, 150, 220, 250])       # Exclusivo
 
 def generate_lidar_sample(center_lat, center_lon, radius=0.05, points=1000, 
                          forest_ratio=0.7, water_ratio=0.1, terrain_variability=1.0):
@@ -22,13 +91,14 @@ def generate_lidar_sample(center_lat, center_lon, radius=0.05, points=1000,
         terrain_variability (float): Multiplicador para variabilidade do terreno
         
     Returns:
-        pd.DataFrame: DataFrame com dados LiDAR simulados
+        LidarPoints: Nuvem de pontos LiDAR simulada (use .to_dataframe() para um DataFrame)
     """
-    np.random.seed(42)  # Para reprodutibilidade
+    # Gerador PCG64 local (reprodutível, sem alterar o estado global do NumPy)
+    rng = np.random.default_rng(42)
     
     # Gerar pontos em coordenadas polares e converter para cartesianas
-    theta = np.random.uniform(0, 2*np.pi, points)
-    r = radius * np.sqrt(np.random.uniform(0, 1, points))
+    theta = rng.uniform(0, 2*np.pi, points)
+    r = radius * np.sqrt(rng.uniform(0, 1, points))
     
     # Converter para coordenadas cartesianas
     x = center_lon + r * np.cos(theta)
@@ -50,86 +120,114 @@ def generate_lidar_sample(center_lat, center_lon, radius=0.05, points=1000,
     # Simulando um rio que corta a área (simplificação de um meandro)
     river_mask = np.abs(np.sin(theta * 2) * normalized_dist) < water_ratio
     
-    # O resto divido entre floresta e outros tipos
-    forest_mask = (~river_mask) & (np.random.random(points) < forest_ratio)
-    vegetation_mask = (~river_mask) & (~forest_mask) & (np.random.random(points) < 0.7)
-    soil_mask = (~river_mask) & (~forest_mask) & (~vegetation_mask) & (np.random.random(points) < 0.8)
-    building_mask = (~river_mask) & (~forest_mask) & (~vegetation_mask) & (~soil_mask)
+    # O resto divido entre floresta e outros tipos, com um único sorteio:
+    # floresta (forest_ratio); do restante, 70% vegetação baixa, 80% do que
+    # sobra solo exposto e o resto construções
+    u = rng.random(points)
+    p_forest = forest_ratio
+    p_veg = p_forest + (1 - p_forest) * 0.7
+    p_soil = p_veg + (1 - p_veg) * 0.8
     
     # Criar array de classificação
-    classification = np.zeros(points, dtype=int)
-    classification[forest_mask] = 1  # Floresta
-    classification[river_mask] = 2   # Água
-    classification[vegetation_mask] = 3  # Vegetação baixa
-    classification[soil_mask] = 4    # Solo exposto
-    classification[building_mask] = 5  # Construções
+    classification = np.where(
+        river_mask,
+        2,  # Água
+        np.select([u < p_forest, u < p_veg, u < p_soil], [1, 3, 4], default=5)
+    )
     
     # Gerar altitudes simuladas que variam conforme o tipo de terreno
     # Base altitude + variação por tipo + distância do centro + ruído
     
     # Altitude base (metros acima do nível do mar)
     # Na Amazônia, altitudes típicas são baixas, entre 30-200m
-    base_altitude = 60 + np.random.normal(0, 10)
+    base_altitude = 60 + rng.normal(0, 10)
     
-    # Criar matriz de elevação
-    z = np.zeros(points)
+    # Terreno: um único buffer de ruído normal, escalado pelo desvio da classe
+    z = rng.standard_normal(points)
+    z *= _CLASS_TERRAIN_SIGMA[classification]
+    z += base_altitude + _CLASS_TERRAIN_OFFSET[classification]
     
-    # Água (rios, etc) - altitude mais baixa e plana
-    z[river_mask] = base_altitude - 5 + np.random.normal(0, 0.5, np.sum(river_mask))
-    
-    # Floresta - maior variabilidade devido às copas das árvores
-    forest_height = np.random.gamma(shape=9, scale=4, size=np.sum(forest_mask))  # Altura das árvores (média ~35m)
-    terrain_under_forest = base_altitude + np.random.normal(0, 5, np.sum(forest_mask))  # Terreno sob a floresta
-    z[forest_mask] = terrain_under_forest + forest_height
-    
-    # Vegetação baixa
-    veg_height = np.random.gamma(shape=2, scale=1.5, size=np.sum(vegetation_mask))  # Altura média ~3m
-    terrain_under_veg = base_altitude + np.random.normal(0, 3, np.sum(vegetation_mask))
-    z[vegetation_mask] = terrain_under_veg + veg_height
-    
-    # Solo exposto - mais plano mas com alguma variação
-    z[soil_mask] = base_altitude + np.random.normal(0, 2, np.sum(soil_mask))
-    
-    # Construções - altura variável
-    build_height = np.random.gamma(shape=3, scale=2, size=np.sum(building_mask))  # Altura média ~6m
-    terrain_under_build = base_altitude + np.random.normal(0, 1, np.sum(building_mask))
-    z[building_mask] = terrain_under_build + build_height
+    # Altura da cobertura (copas, vegetação, construções); forma 0 gera altura 0
+    z += rng.standard_gamma(_CLASS_HEIGHT_SHAPE[classification]) * _CLASS_HEIGHT_SCALE[classification]
     
     # Aplicar o fator de variabilidade global
     z = base_altitude + (z - base_altitude) * terrain_variability
     
     # Intensidade - varia por tipo de superfície
-    intensity = np.zeros(points, dtype=int)
-    intensity[forest_mask] = np.random.randint(40, 120, np.sum(forest_mask))      # Vegetação - reflexão média
-    intensity[river_mask] = np.random.randint(5, 30, np.sum(river_mask))         # Água - baixa reflexão
-    intensity[vegetation_mask] = np.random.randint(50, 150, np.sum(vegetation_mask))  # Vegetação baixa
-    intensity[soil_mask] = np.random.randint(120, 220, np.sum(soil_mask))        # Solo - alta reflexão
-    intensity[building_mask] = np.random.randint(150, 250, np.sum(building_mask))  # Construções - alta reflexão
+    intensity = rng.integers(_CLASS_INTENSITY_LOW[classification], _CLASS_INTENSITY_HIGH[classification])
     
     # Número de retornos (simulação simplificada)
     # Floresta tem mais retornos por pulso
+    forest_mask = classification == 1
     returns = np.ones(points, dtype=int)
-    returns[forest_mask] = np.random.choice([1, 2, 3, 4], size=np.sum(forest_mask), 
+    returns[forest_mask] = rng.choice([1, 2, 3, 4], size=np.count_nonzero(forest_mask), 
                                             p=[0.2, 0.3, 0.3, 0.2])
     
-    # Criar DataFrame
-    df = pd.DataFrame({
-        'X': x,
-        'Y': y,
-        'Z': z,
-        'Intensity': intensity,
-        'Classification': classification,
-        'ReturnNumber': returns
-    })
-    
-    return df
+    return LidarPoints(
+        x=x,
+        y=y,
+        z=z,
+        intensity=intensity,
+        classification=classification,
+        returns=returns
+    )
+
+# Comentários de metadados gravados no início dos CSVs exportados
+_CSV_METADATA = (
+    "# LIDAR data for QGIS - GAIA DIGITAL project\n"
+    "# CRS: EPSG:4326 (WGS 84)\n"
+    "# Classification codes:\n"
+    "# 1: Forest, 2: Water, 3: Low vegetation, 4: Ground, 5: Building\n"
+)
+
+# Perfil GeoTIFF comum aos rasters gerados: blocos internos 256x256, compressão
+# DEFLATE e BigTIFF automático quando o arquivo puder passar de 4 GB
+_GTIFF_PROFILE = {
+    'driver': 'GTiff',
+    'count': 1,
+    'crs': '+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs',
+    'tiled': True,
+    'blockxsize': 256,
+    'blockysize': 256,
+    'compress': 'deflate',
+    'BIGTIFF': 'IF_SAFER',
+}
+
+def _write_geotiff(filepath, data, transform, nodata=None):
+    """
+    Grava uma banda em GeoTIFF bloco a bloco, seguindo os blocos internos do arquivo.
+    
+    Args:
+        filepath (str): Caminho do arquivo de saída
+        data (np.ndarray): Matriz 2D (linhas, colunas) com os valores
+        transform (Affine): Transformação geoespacial do raster
+        nodata (float): Valor sem dados (None = não definido)
+    """
+    # Preditor de ponto flutuante (3) para float, diferença horizontal (2) para inteiros
+    predictor = 3 if np.issubdtype(data.dtype, np.floating) else 2
+    
+    with rasterio.open(
+        filepath,
+        'w',
+        height=data.shape[0],
+        width=data.shape[1],
+        dtype=data.dtype,
+        nodata=nodata,
+        transform=transform,
+        predictor=predictor,
+        **_GTIFF_PROFILE
+    ) as dst:
+        # Cada escrita cobre um bloco 256x256, evitando que o GDAL monte uma
+        # cópia intermediária do raster inteiro
+        for _, window in dst.block_windows(1):
+            dst.write(data[window.toslices()], 1, window=window)
 
 def export_lidar_to_csv(lidar_data, filename="lidar_data.csv"):
     """
     Exporta dados LiDAR para CSV em formato compatível com QGIS.
     
     Args:
-        lidar_data (pd.DataFrame): DataFrame com dados LiDAR
+        lidar_data (LidarPoints | pd.DataFrame): Dados LiDAR
         filename (str): Nome do arquivo para salvar
         
     Returns:
@@ -138,31 +236,93 @@ def export_lidar_to_csv(lidar_data, filename="lidar_data.csv"):
     temp_dir = tempfile.gettempdir()
     filepath = os.path.join(temp_dir, filename)
     
-    # Garantir que temos as colunas necessárias
-    required_cols = ['X', 'Y', 'Z', 'Intensity', 'Classification']
-    for col in required_cols:
-        if col not in lidar_data.columns:
-            lidar_data[col] = 0
+    if isinstance(lidar_data, LidarPoints):
+        # Arrays já contíguos: a tabela Arrow é montada sem passar pelo pandas
+        table = pa.table({name: lidar_data.column(name) for name in LidarPoints._COLUMNS})
+    else:
+        # Garantir que temos as colunas necessárias
+        required_cols = ['X', 'Y', 'Z', 'Intensity', 'Classification']
+        for col in required_cols:
+            if col not in lidar_data.columns:
+                lidar_data[col] = 0
+        table = pa.Table.from_pandas(lidar_data, preserve_index=False)
     
-    # Adicionar metadados como comentários no início do arquivo
-    with open(filepath, 'w') as f:
-        f.write("# LIDAR data for QGIS - GAIA DIGITAL project\n")
-        f.write("# CRS: EPSG:4326 (WGS 84)\n")
-        f.write("# Classification codes:\n")
-        f.write("# 1: Forest, 2: Water, 3: Low vegetation, 4: Ground, 5: Building\n")
+    # Metadados como comentários no início do arquivo, seguidos do cabeçalho
+    header = _CSV_METADATA + ",".join(map(str, table.column_names)) + "\n"
     
-    # Adicionar dados ao arquivo
-    lidar_data.to_csv(filepath, index=False, mode='a')
+    # Escrever os dados com o writer CSV (C++, multithread) do PyArrow
+    with open(filepath, 'wb') as f:
+        f.write(header.encode('utf-8'))
+        pa_csv.write_csv(table, f, write_options=pa_csv.WriteOptions(include_header=False))
     
     return filepath
 
+def _cell_indices(X, Y, xmin, ymax, resolution, height, width):
+    """
+    Converte coordenadas em índices (linha, coluna) de célula do raster.
+    
+    Args:
+        X (np.ndarray): Coordenadas X (longitude)
+        Y (np.ndarray): Coordenadas Y (latitude)
+        xmin (float): Borda oeste do raster
+        ymax (float): Borda norte do raster
+        resolution (float): Resolução do raster em graus
+        height (int): Número de linhas do raster
+        width (int): Número de colunas do raster
+        
+    Returns:
+        tuple: Arrays int32 (linhas, colunas)
+    """
+    # Multiplicar pelo inverso da resolução evita uma divisão por ponto
+    inv_res = 1.0 / resolution
+    cols = ((X - xmin) * inv_res).astype(np.int32)
+    rows = ((ymax - Y) * inv_res).astype(np.int32)  # Inverter Y (raster começa no topo)
+    
+    # Os limites do raster já incluem margem em torno dos pontos; o recorte
+    # apenas absorve erros de arredondamento na borda
+    np.clip(cols, 0, width - 1, out=cols)
+    np.clip(rows, 0, height - 1, out=rows)
+    return rows, cols
+
+def thin_to_grid(lidar_data, resolution=0.001):
+    """
+    Reduz a nuvem de pontos ao ponto mais alto (maior Z) de cada célula da grade.
+    
+    Útil antes de rasterizar/gerar mapas de calor de nuvens superamostradas,
+    quando apenas a superfície (DSM) interessa.
+    
+    Args:
+        lidar_data (LidarPoints | pd.DataFrame): Dados LiDAR
+        resolution (float): Tamanho da célula da grade em graus
+        
+    Returns:
+        LidarPoints | pd.DataFrame: Pontos mantidos, no mesmo tipo e ordem da entrada
+    """
+    X = _column_array(lidar_data, 'X')
+    Y = _column_array(lidar_data, 'Y')
+    Z = _column_array(lidar_data, 'Z')
+    
+    # Grade ancorada no canto noroeste da nuvem
+    xmin, ymax = X.min(), Y.max()
+    width = int((X.max() - xmin) / resolution) + 1
+    height = int((ymax - Y.min()) / resolution) + 1
+    rows, cols = _cell_indices(X, Y, xmin, ymax, resolution, height, width)
+    flat_idx = rows.astype(np.intp) * width + cols
+    
+    # Argmax de Z por célula em uma passada do groupby (Cython) do pandas
+    keep = np.sort(pd.Series(Z).groupby(flat_idx, sort=False).idxmax().to_numpy())
+    
+    if isinstance(lidar_data, LidarPoints):
+        return LidarPoints(**{field: getattr(lidar_data, field)[keep] for field in LidarPoints._COLUMNS.values()})
+    return lidar_data.iloc[keep]
+
 def lidar_to_raster(lidar_data, attribute='Z', resolution=0.001, 
                     filename="lidar_raster.tif", method='mean'):
     """
     Converte dados LiDAR pontuais para um raster (DEM, DSM, etc)
     
     Args:
-        lidar_data (pd.DataFrame): DataFrame com dados LiDAR
+        lidar_data (LidarPoints | pd.DataFrame): Dados LiDAR
         attribute (str): Atributo a rasterizar ('Z', 'Intensity', etc)
         resolution (float): Resolução do raster em graus
         filename (str): Nome do arquivo para salvar
@@ -171,44 +331,47 @@ def lidar_to_raster(lidar_data, attribute='Z', resolution=0.001,
     Returns:
         str: Caminho do arquivo raster salvo
     """
+    # Extrair as colunas uma única vez como arrays NumPy
+    X = _column_array(lidar_data, 'X')
+    Y = _column_array(lidar_data, 'Y')
+    values = _column_array(lidar_data, attribute, dtype=np.float64)
+    
     # Obter limites da área
-    xmin, ymin = lidar_data['X'].min() - resolution, lidar_data['Y'].min() - resolution
-    xmax, ymax = lidar_data['X'].max() + resolution, lidar_data['Y'].max() + resolution
+    xmin, ymin = X.min() - resolution, Y.min() - resolution
+    xmax, ymax = X.max() + resolution, Y.max() + resolution
     
     # Calcular dimensões do raster
     width = int((xmax - xmin) / resolution)
     height = int((ymax - ymin) / resolution)
     
-    # Inicializar array para o raster
-    raster_data = np.zeros((height, width), dtype=np.float32)
-    raster_data.fill(np.nan)  # Preencher com NaN (sem dados)
+    # Calcular a célula correspondente de todos os pontos de uma vez
+    cells = _cell_indices(X, Y, xmin, ymax, resolution, height, width)
     
-    # Para cada ponto, calcular a célula correspondente
-    for _, point in lidar_data.iterrows():
-        x, y = point['X'], point['Y']
-        col = int((x - xmin) / resolution)
-        row = int((ymax - y) / resolution)  # Inverter Y (raster começa no topo)
+    # Implementar diferentes métodos de agregação
+    if method == 'count':
+        # Contagem inteira: células sem pontos ficam com 0, usado como nodata
+        flat_idx = cells[0].astype(np.intp) * width + cells[1]
+        raster_data = np.bincount(flat_idx, minlength=height * width).astype(np.int32).reshape(height, width)
+        nodata = 0
+    else:
+        # Inicializar o raster já com nodata: só as células com pontos são escritas
+        nodata = -9999
+        raster_data = np.full((height, width), nodata, dtype=np.float32)
+        
+        # Índice linear de cada ponto (linha * largura + coluna)
+        flat_idx = cells[0].astype(np.intp) * width + cells[1]
         
-        # Garantir que estamos dentro dos limites
-        if 0 <= row < height and 0 <= col < width:
-            # Implementar diferentes métodos de agregação
-            if method == 'max':
-                if np.isnan(raster_data[row, col]) or point[attribute] > raster_data[row, col]:
-                    raster_data[row, col] = point[attribute]
-            elif method == 'min':
-                if np.isnan(raster_data[row, col]) or point[attribute] < raster_data[row, col]:
-                    raster_data[row, col] = point[attribute]
-            elif method == 'count':
-                if np.isnan(raster_data[row, col]):
-                    raster_data[row, col] = 1
-                else:
-                    raster_data[row, col] += 1
-            else:  # default: média
-                if np.isnan(raster_data[row, col]):
-                    raster_data[row, col] = point[attribute]
-                else:
-                    # Média cumulativa aproximada
-                    raster_data[row, col] = (raster_data[row, col] + point[attribute]) / 2
+        if method in ('max', 'min'):
+            # Agregação em uma passada pelo groupby (Cython) do pandas;
+            # células sem pontos permanecem com nodata
+            grouped = pd.Series(values).groupby(flat_idx, sort=False).agg(method)
+            raster_data.ravel()[grouped.index.to_numpy()] = grouped.to_numpy()
+        else:  # default: média exata (soma / contagem)
+            # Reduções por célula com bincount sobre o índice linear
+            counts = np.bincount(flat_idx, minlength=height * width)
+            sums = np.bincount(flat_idx, weights=values, minlength=height * width)
+            # Divisão direto no raster, apenas nas células com dados
+            np.divide(sums, counts, out=raster_data.ravel(), where=counts > 0)
     
     # Definir transformação geoespacial
     transform = from_origin(xmin, ymax, resolution, resolution)
@@ -218,21 +381,7 @@ def lidar_to_raster(lidar_data, attribute='Z', resolution=0.001,
     filepath = os.path.join(temp_dir, filename)
     
     # Criar arquivo raster
-    with rasterio.open(
-        filepath,
-        'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=1,
-        dtype=raster_data.dtype,
-        crs='+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs',
-        transform=transform,
-    ) as dst:
-        # Preencher NaN com valores nodata
-        raster_data = np.nan_to_num(raster_data, nan=-9999)
-        dst.write(raster_data, 1)
-        dst.nodata = -9999
+    _write_geotiff(filepath, raster_data, transform, nodata)
     
     return filepath
 
@@ -248,50 +397,48 @@ def create_contour_lines(raster_file, interval=5.0, filename="contour.gpkg"):
     Returns:
         str: Caminho do arquivo de contornos salvo
     """
-    import matplotlib.pyplot as plt
-    from matplotlib.contour import QuadContourSet
-    import rasterio
-    
     # Abrir o arquivo raster
     with rasterio.open(raster_file) as src:
         elevation = src.read(1)
         transform = src.transform
         
-        # Substituir valores nodata por NaN
+        # Substituir valores nodata por NaN (tratados como máscara no contorno)
         nodata = src.nodata
         elevation = np.where(elevation == nodata, np.nan, elevation)
         
-        # Criar grade de coordenadas
+        # Coordenadas geográficas dos centros das células (raster sem rotação)
         height, width = elevation.shape
-        rows, cols = np.mgrid[0:height, 0:width]
-        
-        # Converter para coordenadas geográficas
-        x_coords = transform[0] + cols * transform[1]
-        y_coords = transform[3] + rows * transform[5]
+        x_coords = transform.c + (np.arange(width) + 0.5) * transform.a
+        y_coords = transform.f + (np.arange(height) + 0.5) * transform.e
         
         # Calcular os níveis para as curvas de contorno
         min_val = np.nanmin(elevation)
         max_val = np.nanmax(elevation)
         levels = np.arange(min_val - (min_val % interval), max_val + interval, interval)
         
-        # Gerar contornos
-        contour_set = plt.contour(x_coords, y_coords, elevation, levels=levels)
-        plt.close()  # Fechar a figura para não exibi-la
+        # Gerar contornos com marching squares (contourpy), sem pipeline de renderização
+        generator = contour_generator(x=x_coords, y=y_coords, z=elevation, line_type=LineType.Separate)
         
-        # Converter para GeoDataFrame
-        contours = []
+        # Extrair os vértices de todos os contornos
+        vertex_arrays = []
         elevations = []
+        for level in levels:
+            for vertices in generator.lines(level):
+                if len(vertices) > 1:
+                    vertex_arrays.append(vertices)
+                    elevations.append(level)
         
-        # Extrair os contornos
-        for i, line in enumerate(contour_set.collections):
-            for path in line.get_paths():
-                if len(path.vertices) > 1:
-                    contours.append(LineString(path.vertices))
-                    elevations.append(contour_set.levels[i])
+        # Construir todas as LineStrings em uma única chamada ao GEOS
+        if vertex_arrays:
+            lengths = [len(v) for v in vertex_arrays]
+            indices = np.repeat(np.arange(len(vertex_arrays)), lengths)
+            contours = shapely.linestrings(np.vstack(vertex_arrays), indices=indices)
+        else:
+            contours = []
         
         # Criar GeoDataFrame
         gdf = gpd.GeoDataFrame({
-            'elevation': elevations,
+            'elevation': np.asarray(elevations, dtype=np.float64),
             'geometry': contours
         }, crs="EPSG:4326")
         
@@ -302,13 +449,154 @@ def create_contour_lines(raster_file, interval=5.0, filename="contour.gpkg"):
         
         return filepath
 
+@functools.lru_cache(maxsize=32)
+def _gaussian_kernel(radius_cells):
+    """
+    Kernel gaussiano truncado e^(-(d²/r²)/2), zerado fora do raio.
+    
+    Args:
+        radius_cells (int): Raio do kernel em células
+        
+    Returns:
+        np.ndarray: Matriz (2r+1, 2r+1) com os pesos do kernel (somente leitura)
+    """
+    offsets = np.arange(-radius_cells, radius_cells + 1)
+    inv_r2 = 1.0 / (radius_cells * radius_cells)
+    # e^(-(dx²+dy²)/2r²) = e^(-dx²/2r²) · e^(-dy²/2r²): só 2r+1 exponenciais
+    profile = np.exp(-0.5 * inv_r2 * offsets.astype(np.float64) ** 2)
+    kernel = np.outer(profile, profile)
+    d2 = offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2
+    kernel[d2 * inv_r2 > 1.0] = 0.0
+    # O mesmo array é compartilhado entre chamadas via cache
+    kernel.flags.writeable = False
+    return kernel
+
+def _fft_convolve_full(grid, kernel):
+    """Convolução 2D completa ('full') via FFT real."""
+    kh, kw = kernel.shape
+    shape = (grid.shape[0] + kh - 1, grid.shape[1] + kw - 1)
+    spectrum = np.fft.rfft2(grid, shape) * np.fft.rfft2(kernel, shape)
+    return np.fft.irfft2(spectrum, shape)
+
+# Grades (já expandidas) a partir deste número de células são divididas em
+# faixas de linhas processadas em paralelo
+_PARALLEL_FFT_MIN_CELLS = 4_000_000
+
+def _fft_convolve_same(grid, kernel):
+    """
+    Convolução 2D via FFT, recortada para o tamanho de `grid` (modo 'same',
+    com zeros fora dos limites).
+    
+    Em grades grandes, com mais de um núcleo disponível, as linhas são
+    divididas em faixas convoluídas em paralelo (o NumPy libera o GIL durante
+    a FFT) e recombinadas por sobreposição e soma (overlap-add).
+    
+    Args:
+        grid (np.ndarray): Raster de entrada
+        kernel (np.ndarray): Kernel com dimensões ímpares
+        
+    Returns:
+        np.ndarray: Raster convoluído com a forma de `grid`
+    """
+    kh, kw = kernel.shape
+    height, width = grid.shape
+    workers = min(os.cpu_count() or 1, max(1, height // kh))
+    
+    if workers > 1 and (height + kh - 1) * (width + kw - 1) >= _PARALLEL_FFT_MIN_CELLS:
+        bounds = np.linspace(0, height, workers + 1).astype(int)
+        bands = [grid[r0:r1] for r0, r1 in zip(bounds[:-1], bounds[1:])]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(lambda band: _fft_convolve_full(band, kernel), bands))
+        # Cada faixa transborda kh-1 linhas sobre a seguinte: somar as sobreposições
+        full = np.zeros((height + kh - 1, width + kw - 1))
+        for r0, part in zip(bounds[:-1], parts):
+            full[r0:r0 + part.shape[0]] += part
+    else:
+        full = _fft_convolve_full(grid, kernel)
+    
+    top, left = kh // 2, kw // 2
+    result = full[top:top + height, left:left + width]
+    # Zerar resíduos de arredondamento da FFT (valores ~1e-16 relativos ao
+    # máximo em módulo; somas negativas de pesos negativos são preservadas)
+    result = result.copy()
+    magnitude = np.abs(result)
+    result[magnitude < 1e-9 * magnitude.max()] = 0.0
+    return result
+
+# Número máximo de contribuições (célula ocupada × célula do kernel) somadas por lote
+_STAMP_BATCH_ELEMENTS = 1 << 20
+
+def _stamp_convolve_same(grid, kernel):
+    """
+    Convolução 2D direta em modo 'same': carimba o kernel em cada célula não
+    nula de `grid`. Eficiente quando poucas células têm pontos.
+    
+    Args:
+        grid (np.ndarray): Raster de entrada
+        kernel (np.ndarray): Kernel simétrico com dimensões ímpares
+        
+    Returns:
+        np.ndarray: Raster convoluído com a forma de `grid`
+    """
+    kh, kw = kernel.shape
+    top, left = kh // 2, kw // 2
+    height, width = grid.shape
+    # Margem do tamanho do kernel evita recortes nas bordas
+    padded_height, padded_width = height + kh - 1, width + kw - 1
+    
+    # Deslocamentos lineares e pesos das células não nulas do kernel (dentro
+    # do raio), calculados uma única vez para todos os carimbos
+    k_rows, k_cols = np.nonzero(kernel)
+    k_offsets = k_rows * padded_width + k_cols
+    k_weights = kernel[k_rows, k_cols]
+    
+    rows, cols = np.nonzero(grid)
+    origins = rows * padded_width + cols
+    weights = grid[rows, cols]
+    
+    # Soma todas as contribuições com bincount, em lotes de tamanho limitado
+    padded = np.zeros(padded_height * padded_width)
+    batch = max(1, _STAMP_BATCH_ELEMENTS // len(k_offsets))
+    for start in range(0, len(origins), batch):
+        stop = start + batch
+        targets = (origins[start:stop, np.newaxis] + k_offsets).ravel()
+        contributions = np.outer(weights[start:stop], k_weights).ravel()
+        padded += np.bincount(targets, weights=contributions, minlength=padded.size)
+    
+    return padded.reshape(padded_height, padded_width)[top:top + height, left:left + width]
+
+# Custo aproximado de cada contribuição do carimbo (espalhamento via bincount)
+# em unidades do custo por célula da FFT
+_STAMP_COST_FACTOR = 2.5
+
+def _convolve_same(grid, kernel):
+    """
+    Convolução 2D em modo 'same', escolhendo o método de menor custo estimado:
+    carimbo direto (∝ células ocupadas × tamanho do kernel) ou FFT
+    (∝ P·log2 P, com P o tamanho da grade expandida).
+    
+    Args:
+        grid (np.ndarray): Raster de entrada
+        kernel (np.ndarray): Kernel simétrico com dimensões ímpares
+        
+    Returns:
+        np.ndarray: Raster convoluído com a forma de `grid`
+    """
+    occupied = np.count_nonzero(grid)
+    padded_size = (grid.shape[0] + kernel.shape[0] - 1) * (grid.shape[1] + kernel.shape[1] - 1)
+    stamp_cost = _STAMP_COST_FACTOR * occupied * kernel.size
+    fft_cost = 0.5 * padded_size * np.log2(padded_size)
+    if stamp_cost < fft_cost:
+        return _stamp_convolve_same(grid, kernel)
+    return _fft_convolve_same(grid, kernel)
+
 def points_to_heatmap(points_gdf, attribute=None, resolution=0.001, 
                      radius=0.01, filename="heatmap.tif"):
     """
     Cria um mapa de calor a partir de pontos.
     
     Args:
-        points_gdf (gpd.GeoDataFrame): GeoDataFrame com geometria de pontos
+        points_gdf (gpd.GeoDataFrame | LidarPoints): Pontos (geometria ou arrays X/Y)
         attribute (str): Atributo para ponderação (None = sem ponderação)
         resolution (float): Resolução do raster em graus
         radius (float): Raio de influência de cada ponto
@@ -317,57 +605,44 @@ def points_to_heatmap(points_gdf, attribute=None, resolution=0.001,
     Returns:
         str: Caminho do arquivo de mapa de calor salvo
     """
-    # Converter GeoDataFrame para DataFrame regular com coordenadas X e Y
-    points_df = pd.DataFrame({
-        'X': points_gdf.geometry.x,
-        'Y': points_gdf.geometry.y
-    })
-    
-    # Adicionar atributo de peso se especificado
-    if attribute and attribute in points_gdf.columns:
-        points_df['weight'] = points_gdf[attribute]
+    if isinstance(points_gdf, LidarPoints):
+        X, Y = points_gdf.x, points_gdf.y
+        has_attribute = attribute in LidarPoints._COLUMNS
+    else:
+        # Extrair coordenadas X e Y da geometria diretamente como arrays NumPy
+        X = points_gdf.geometry.x.to_numpy()
+        Y = points_gdf.geometry.y.to_numpy()
+        has_attribute = attribute in points_gdf.columns
+    
+    # Atributo de peso se especificado
+    if attribute and has_attribute:
+        weights = _column_array(points_gdf, attribute, dtype=np.float64)
     else:
-        points_df['weight'] = 1.0
+        weights = np.ones(len(X))
     
     # Obter limites da área
-    xmin, ymin = points_df['X'].min() - radius, points_df['Y'].min() - radius
-    xmax, ymax = points_df['X'].max() + radius, points_df['Y'].max() + radius
+    xmin, ymin = X.min() - radius, Y.min() - radius
+    xmax, ymax = X.max() + radius, Y.max() + radius
     
     # Calcular dimensões do raster
     width = int((xmax - xmin) / resolution)
     height = int((ymax - ymin) / resolution)
     
-    # Inicializar array para o raster
-    heatmap = np.zeros((height, width), dtype=np.float32)
-    
     # Converter raio de graus para células do raster
     radius_cells = int(radius / resolution)
     
-    # Para cada ponto, calcular influência no mapa de calor
-    for _, point in points_df.iterrows():
-        x, y, weight = point['X'], point['Y'], point['weight']
-        
-        # Converter coordenadas para índices de célula
-        center_col = int((x - xmin) / resolution)
-        center_row = int((ymax - y) / resolution)
-        
-        # Calcular intervalos de células afetadas
-        row_min = max(0, center_row - radius_cells)
-        row_max = min(height, center_row + radius_cells + 1)
-        col_min = max(0, center_col - radius_cells)
-        col_max = min(width, center_col + radius_cells + 1)
-        
-        # Aplicar kernel gaussiano para suavização
-        for row in range(row_min, row_max):
-            for col in range(col_min, col_max):
-                # Calcular distância ao centro
-                dist = np.sqrt((row - center_row)**2 + (col - center_col)**2)
-                
-                # Se está dentro do raio, aplicar peso com decaimento gaussiano
-                if dist <= radius_cells:
-                    # Kernel gaussiano: e^(-(d²/r²)/2)
-                    factor = np.exp(-0.5 * (dist / radius_cells)**2) * weight
-                    heatmap[row, col] += factor
+    # Converter coordenadas para índices de célula (todos os pontos de uma vez)
+    center_rows, center_cols = _cell_indices(X, Y, xmin, ymax, resolution, height, width)
+    
+    # Como o kernel é o mesmo para todos os pontos, o mapa de calor é a soma
+    # dos pesos por célula convoluída uma única vez com o kernel gaussiano
+    flat_idx = center_rows.astype(np.intp) * width + center_cols
+    # Pesos não finitos (NaN/inf no atributo) são descartados: na FFT um único
+    # NaN se espalharia por toda a grade
+    weights = np.where(np.isfinite(weights), weights, 0.0)
+    accumulated = np.bincount(flat_idx, weights=weights, minlength=height * width)
+    kernel = _gaussian_kernel(max(radius_cells, 1))  # Evita divisão por zero com raio < resolução
+    heatmap = _convolve_same(accumulated.reshape(height, width), kernel).astype(np.float32)
     
     # Definir transformação geoespacial
     transform = from_origin(xmin, ymax, resolution, resolution)
@@ -381,18 +656,7 @@ def points_to_heatmap(points_gdf, attribute=None, resolution=0.001,
         heatmap = heatmap / heatmap.max()
     
     # Criar arquivo raster
-    with rasterio.open(
-        filepath,
-        'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=1,
-        dtype=heatmap.dtype,
-        crs='+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs',
-        transform=transform,
-    ) as dst:
-        dst.write(heatmap, 1)
+    _write_geotiff(filepath, heatmap, transform)
     
     return filepath
 
@@ -413,6 +677,7 @@ if __name__ == "__main__":
     )
     
     # Verificar os dados
+    lidar_sample = lidar_sample.to_dataframe()
     print(lidar_sample.head())
     print(f"Pontos gerados: {len(lidar_sample)}")
     
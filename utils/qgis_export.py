@@ -1,40 +1,35 @@
+import contextlib
+import copy
+import hashlib
 import os
+import re
+import shutil
 import tempfile
+import time
 import zipfile
-import json
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from xml.sax.saxutils import escape as xml_escape
+import orjson
 
-def create_qgis_style_file(filepath, icon_type="ship"):
-    """
-    Cria um arquivo de estilo QML para QGIS com ícone personalizado.
-    
-    Args:
-        filepath (str): Caminho do arquivo a ser estilizado
-        icon_type (str): Tipo de ícone ('ship', 'flag', 'marker', etc.)
-        
-    Returns:
-        str: Caminho do arquivo QML criado
-    """
-    # Definir o ícone com base no tipo selecionado
-    icon_path = "transport/transport_nautical_harbour.svg"
-    icon_color = "0,0,0,255"
-    
-    if icon_type == "ship":
-        icon_path = "transport/transport_nautical_harbour.svg"
-    elif icon_type == "flag":
-        icon_path = "gpsicons/flag.svg"
-    elif icon_type == "marker":
-        icon_path = "gpsicons/pin_red.svg"
-    elif icon_type == "tree":
-        icon_path = "ecology/tree.svg" 
-        icon_color = "0,100,0,255"
-    elif icon_type == "water":
-        icon_path = "water/water_tank.svg"
-        icon_color = "0,0,255,255"
-        
-    # Criar conteúdo QML
-    qml_content = f"""<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+# lxml (opcional) serializa e indenta a árvore em C, em uma única passada;
+# sem ele, usa-se o ElementTree da biblioteca padrão (API compatível)
+try:
+    from lxml import etree as ET
+    _HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _HAS_LXML = False
+
+# Ícone SVG (da biblioteca do QGIS) e cor RGBA por tipo de ícone
+_ICON_TABLE = {
+    "ship": ("transport/transport_nautical_harbour.svg", "0,0,0,255"),
+    "flag": ("gpsicons/flag.svg", "0,0,0,255"),
+    "marker": ("gpsicons/pin_red.svg", "0,0,0,255"),
+    "tree": ("ecology/tree.svg", "0,100,0,255"),
+    "water": ("water/water_tank.svg", "0,0,255,255"),
+}
+
+# Modelos QML (constantes; o de marcador recebe {icon_path} e {icon_color})
+_QML_MARKER_TEMPLATE = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <renderer-v2 forceraster="0" type="singleSymbol" symbollevels="0" enableorderby="0">
     <symbols>
@@ -65,25 +60,8 @@ def create_qgis_style_file(filepath, icon_type="ship"):
   </renderer-v2>
 </qgis>
 """
-    
-    # Salvar para arquivo
-    style_filepath = f"{filepath}.qml"
-    with open(style_filepath, 'w') as f:
-        f.write(qml_content)
-    
-    return style_filepath
 
-def create_lidar_style_file(filepath):
-    """
-    Cria um arquivo de estilo QML para visualização de nuvem de pontos LiDAR no QGIS.
-    
-    Args:
-        filepath (str): Caminho do arquivo a ser estilizado
-        
-    Returns:
-        str: Caminho do arquivo QML criado
-    """
-    qml_content = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+_QML_LIDAR = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <renderer-v2 forceraster="0" type="categorizedSymbol" attr="Classification" symbollevels="0" enableorderby="0">
     <categories>
@@ -153,25 +131,8 @@ def create_lidar_style_file(filepath):
   </renderer-v2>
 </qgis>
 """
-    
-    # Salvar para arquivo
-    style_filepath = f"{filepath}.qml"
-    with open(style_filepath, 'w') as f:
-        f.write(qml_content)
-    
-    return style_filepath
 
-def create_elevation_style_file(filepath):
-    """
-    Cria um arquivo de estilo QML para visualização de dados de elevação (DEM) no QGIS.
-    
-    Args:
-        filepath (str): Caminho do arquivo a ser estilizado
-        
-    Returns:
-        str: Caminho do arquivo QML criado
-    """
-    qml_content = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+_QML_ELEVATION = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
 <qgis version="3.22.0-Białowieża" styleCategories="Symbology">
   <pipe>
     <rasterrenderer opacity="1" alphaBand="-1" band="1" type="singlebandpseudocolor" classificationMin="0" classificationMax="100">
@@ -208,131 +169,405 @@ def create_elevation_style_file(filepath):
   <blendMode>0</blendMode>
 </qgis>
 """
+
+# Arquivos QML já gravados nesta execução: SHA-256 do conteúdo -> caminho no cache
+_STYLE_CACHE = {}
+
+def _write_style_file(style_filepath, qml_content):
+    """
+    Grava um estilo QML reaproveitando a cópia em cache de conteúdo idêntico.
+    
+    Cada conteúdo distinto é gravado uma única vez em um diretório de cache;
+    os arquivos de estilo seguintes são hard links para ele (ou cópias, se o
+    link não for possível, p.ex. entre dispositivos diferentes).
     
-    # Salvar para arquivo
-    style_filepath = f"{filepath}.qml"
-    with open(style_filepath, 'w') as f:
-        f.write(qml_content)
+    Args:
+        style_filepath (str): Caminho do arquivo QML a criar
+        qml_content (str): Conteúdo QML
+        
+    Returns:
+        str: Caminho do arquivo QML criado
+    """
+    # Codificar uma única vez: os mesmos bytes servem para a chave e a gravação
+    qml_bytes = qml_content.encode('utf-8')
+    key = hashlib.sha256(qml_bytes).hexdigest()
+    cached_path = _STYLE_CACHE.get(key)
+    if cached_path is None:
+        cached_path = _store_cached_style(key, qml_bytes)
+    
+    # os.link não sobrescreve: remover um estilo anterior no mesmo caminho
+    try:
+        os.remove(style_filepath)
+    except FileNotFoundError:
+        pass
+    
+    try:
+        _link_or_copy(cached_path, style_filepath)
+    except FileNotFoundError:
+        # Cópia em cache removida externamente: gravá-la de novo
+        cached_path = _store_cached_style(key, qml_bytes)
+        _link_or_copy(cached_path, style_filepath)
     
     return style_filepath
 
-def create_qgis_project_file(layers, output_file="amazon_project.qgs", 
-                            title="Projeto Amazônia GAIA DIGITAL"):
+def _store_cached_style(key, qml_bytes):
+    """Grava o conteúdo QML (bytes UTF-8) no diretório de cache e registra seu caminho."""
+    cache_dir = os.path.join(tempfile.gettempdir(), "gaia_qml_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = os.path.join(cache_dir, f"{key}.qml")
+    # Sem buffer do Python: o conteúdo inteiro vai em uma única chamada write()
+    with open(cached_path, 'wb', buffering=0) as f:
+        f.write(qml_bytes)
+    _STYLE_CACHE[key] = cached_path
+    return cached_path
+
+def _link_or_copy(source, destination):
+    """Cria um hard link para `source` ou, se não for possível, copia o arquivo."""
+    try:
+        os.link(source, destination)
+    except FileNotFoundError:
+        # Sem fallback de cópia: o chamador regrava a cópia em cache ausente
+        raise
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def _style_path(filepath, output_dir):
+    """Caminho do QML de `filepath`: ao lado do arquivo ou em `output_dir`."""
+    if output_dir is None:
+        return f"{filepath}.qml"
+    return os.path.join(output_dir, f"{os.path.basename(filepath)}.qml")
+
+def create_qgis_style_file(filepath, icon_type="ship", output_dir=None):
     """
-    Cria um arquivo de projeto QGIS completo com as camadas especificadas.
+    Cria um arquivo de estilo QML para QGIS com ícone personalizado.
     
     Args:
-        layers (list): Lista de dicionários com informações de camadas
-                       Cada camada deve ter: 'path', 'name', 'type', e opcionalmente 'style'
-        output_file (str): Nome do arquivo de projeto
-        title (str): Título do projeto
+        filepath (str): Caminho do arquivo a ser estilizado
+        icon_type (str): Tipo de ícone ('ship', 'flag', 'marker', etc.)
+        output_dir (str): Diretório do QML (None = ao lado do arquivo)
         
     Returns:
-        str: Caminho do arquivo de projeto QGIS criado
+        str: Caminho do arquivo QML criado
     """
-    # Criar estrutura XML do projeto
-    root = ET.Element("qgis")
-    root.set("projectname", title)
-    root.set("version", "3.22.0-Białowieża")
+    # Definir o ícone com base no tipo selecionado (padrão: caravela)
+    icon_path, icon_color = _ICON_TABLE.get(icon_type, _ICON_TABLE["ship"])
+    qml_content = _QML_MARKER_TEMPLATE.format_map({'icon_path': icon_path, 'icon_color': icon_color})
     
-    # Adicionar sistema de referência
-    projectcrs = ET.SubElement(root, "projectCrs")
-    spatialrefsys = ET.SubElement(projectcrs, "spatialrefsys")
-    ET.SubElement(spatialrefsys, "wkt").text = "GEOGCS[\"WGS 84\",DATUM[\"WGS_1984\",SPHEROID[\"WGS 84\",6378137,298.257223563]],PRIMEM[\"Greenwich\",0],UNIT[\"degree\",0.0174532925199433]]"
-    ET.SubElement(spatialrefsys, "proj4").text = "+proj=longlat +datum=WGS84 +no_defs"
-    ET.SubElement(spatialrefsys, "srsid").text = "3452"
-    ET.SubElement(spatialrefsys, "srid").text = "4326"
-    ET.SubElement(spatialrefsys, "authid").text = "EPSG:4326"
-    ET.SubElement(spatialrefsys, "description").text = "WGS 84"
-    ET.SubElement(spatialrefsys, "projectionacronym").text = "longlat"
-    ET.SubElement(spatialrefsys, "ellipsoidacronym").text = "WGS84"
-    ET.SubElement(spatialrefsys, "geographicflag").text = "true"
+    # Salvar para arquivo (a partir do cache de estilos)
+    return _write_style_file(_style_path(filepath, output_dir), qml_content)
+
+def create_lidar_style_file(filepath, output_dir=None):
+    """
+    Cria um arquivo de estilo QML para visualização de nuvem de pontos LiDAR no QGIS.
     
-    # Configurar visualização do mapa
-    mapcanvas = ET.SubElement(root, "mapcanvas")
-    mapcanvas.set("name", "theMapCanvas")
-    ET.SubElement(mapcanvas, "units").text = "degrees"
+    Args:
+        filepath (str): Caminho do arquivo a ser estilizado
+        output_dir (str): Diretório do QML (None = ao lado do arquivo)
+        
+    Returns:
+        str: Caminho do arquivo QML criado
+    """
+    # Salvar para arquivo (a partir do cache de estilos)
+    return _write_style_file(_style_path(filepath, output_dir), _QML_LIDAR)
+
+def create_elevation_style_file(filepath, output_dir=None):
+    """
+    Cria um arquivo de estilo QML para visualização de dados de elevação (DEM) no QGIS.
     
-    # Definir extensão do mapa (aproximadamente região amazônica)
-    extent = ET.SubElement(mapcanvas, "extent")
-    ET.SubElement(extent, "xmin").text = "-65.0"
-    ET.SubElement(extent, "ymin").text = "-10.0"
-    ET.SubElement(extent, "xmax").text = "-50.0"
-    ET.SubElement(extent, "ymax").text = "0.0"
-    ET.SubElement(mapcanvas, "rotation").text = "0"
+    Args:
+        filepath (str): Caminho do arquivo a ser estilizado
+        output_dir (str): Diretório do QML (None = ao lado do arquivo)
+        
+    Returns:
+        str: Caminho do arquivo QML criado
+    """
+    # Salvar para arquivo (a partir do cache de estilos)
+    return _write_style_file(_style_path(filepath, output_dir), _QML_ELEVATION)
+
+# Trechos constantes do projeto QGIS (CRS do projeto e extensão do mapa,
+# aproximadamente a região amazônica), já indentados
+_PROJECT_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+_PROJECT_STATIC_XML = """  <projectCrs>
+    <spatialrefsys>
+      <wkt>GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]</wkt>
+      <proj4>+proj=longlat +datum=WGS84 +no_defs</proj4>
+      <srsid>3452</srsid>
+      <srid>4326</srid>
+      <authid>EPSG:4326</authid>
+      <description>WGS 84</description>
+      <projectionacronym>longlat</projectionacronym>
+      <ellipsoidacronym>WGS84</ellipsoidacronym>
+      <geographicflag>true</geographicflag>
+    </spatialrefsys>
+  </projectCrs>
+  <mapcanvas name="theMapCanvas">
+    <units>degrees</units>
+    <extent>
+      <xmin>-65.0</xmin>
+      <ymin>-10.0</ymin>
+      <xmax>-50.0</xmax>
+      <ymax>0.0</ymax>
+    </extent>
+    <rotation>0</rotation>
+  </mapcanvas>
+"""
+
+# Bloco de CRS (WGS 84) comum a todas as camadas, montado uma única vez
+_LAYER_SRS = ET.fromstring(
+    "<srs><spatialrefsys>"
+    "<wkt>GEOGCS[\"WGS 84\",DATUM[\"WGS_1984\",SPHEROID[\"WGS 84\",6378137,298.257223563]],PRIMEM[\"Greenwich\",0],UNIT[\"degree\",0.0174532925199433]]</wkt>"
+    "<proj4>+proj=longlat +datum=WGS84 +no_defs</proj4>"
+    "<srsid>3452</srsid>"
+    "<srid>4326</srid>"
+    "<authid>EPSG:4326</authid>"
+    "</spatialrefsys></srs>"
+)
+
+def _xml_fragment(element, level, pretty=True):
+    """
+    Serializa um elemento como trecho do documento do projeto.
     
-    # Adicionar estrutura de camadas
-    layer_tree_group = ET.SubElement(root, "layer-tree-group")
+    Args:
+        element (Element): Elemento XML (sem pai)
+        level (int): Nível de indentação do elemento no documento
+        pretty (bool): Se True, indenta o trecho e termina com quebra de linha
+        
+    Returns:
+        str: XML do elemento
+    """
+    if not pretty:
+        return ET.tostring(element, encoding="unicode")
+    ET.indent(element, space="  ", level=level)
+    return "  " * level + ET.tostring(element, encoding="unicode") + "\n"
+
+def _compact_xml(text):
+    """Remove as quebras de linha e a indentação de um trecho XML constante."""
+    return re.sub(r"(?<=[>}])\s+(?=[<{])", "", text).strip()
+
+# Até este número de camadas o projeto é montado por modelos de texto, sem
+# construir elementos XML (caso de prepare_export_files, com até 3 camadas).
+# Os modelos seguem a serialização do xml.etree (elementos vazios em " />");
+# pelo lxml a árvore grava "/>", forma equivalente para o QGIS
+_FAST_PATH_MAX_LAYERS = 8
+
+# Modelos dos trechos de cada camada (valores já escapados para XML)
+_TREE_LAYER_TEMPLATE = '    <layer-tree-layer id="{id}" name="{name}" checked="Qt::Checked" expanded="1" source="{source}" />\n'
+_ORDER_ITEM_TEMPLATE = '      <item>{id_text}</item>\n'
+_LEGEND_LAYER_TEMPLATE = '    <legendlayer open="true" checked="Qt::Checked" name="{name}" showFeatureCount="0" />\n'
+_MAP_LAYER_TEMPLATE = (
+    '  <maplayer type="{type}" geometry="{geometry}" id="{id}" name="{name}" readOnly="0">\n'
+    + _xml_fragment(copy.deepcopy(_LAYER_SRS), 2)
+    + '{pipe}'
+    '  </maplayer>\n'
+)
+_MAP_LAYER_PIPE = '    <pipe>\n      <renderer-v2 type="singleSymbol" />\n    </pipe>\n'
+
+# Modelos por formato de saída (True = indentado, False = compacto)
+_LAYER_TEMPLATES = {
+    True: (_TREE_LAYER_TEMPLATE, _ORDER_ITEM_TEMPLATE, _LEGEND_LAYER_TEMPLATE, _MAP_LAYER_TEMPLATE, _MAP_LAYER_PIPE),
+}
+_LAYER_TEMPLATES[False] = tuple(_compact_xml(template) for template in _LAYER_TEMPLATES[True])
+
+# Trechos fixos do documento entre as listas de camadas, por formato de saída
+_PROJECT_SECTIONS = {
+    True: (
+        _PROJECT_STATIC_XML + "  <layer-tree-group>\n",
+        "  </layer-tree-group>\n  <layer-tree-canvas>\n    <custom-order enabled=\"0\">\n",
+        "    </custom-order>\n  </layer-tree-canvas>\n  <mapcanvas-items />\n  <legendlayers>\n",
+        "  </legendlayers>\n",
+        "</qgis>",
+    ),
+}
+_PROJECT_SECTIONS[False] = tuple(_compact_xml(section) for section in _PROJECT_SECTIONS[True])
+
+# Escape de valores de atributo (mesmas entidades usadas pelo ElementTree)
+_XML_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}
+
+def _layer_id(index, path):
+    """Identificador da camada no projeto: posição (a partir de 1) + nome do arquivo sem extensão."""
+    return f"layer_{index + 1}_{os.path.splitext(os.path.basename(path))[0]}"
+
+def _project_fragments_from_templates(layers, pretty=False):
+    """
+    Monta os trechos XML das camadas por modelos de texto.
     
-    # Adicionar camadas ao projeto
-    layer_order = ET.SubElement(root, "layer-tree-canvas")
-    custom_order = ET.SubElement(layer_order, "custom-order")
-    custom_order.set("enabled", "0")
+    Args:
+        layers (list): Lista de dicionários com informações de camadas
+        pretty (bool): Se True, usa os modelos indentados
+        
+    Returns:
+        tuple: Listas de trechos (árvore, ordem, legenda, camadas do mapa)
+    """
+    tree_template, item_template, legend_template, map_template, pipe = _LAYER_TEMPLATES[pretty]
+    tree_layers, order_items, legend_layers, map_layers = [], [], [], []
+    for i, layer in enumerate(layers):
+        layer_id = _layer_id(i, layer['path'])
+        attrs = {
+            'id': xml_escape(layer_id, _XML_ATTR_ENTITIES),
+            'name': xml_escape(layer['name'], _XML_ATTR_ENTITIES),
+            'source': xml_escape(layer['path'], _XML_ATTR_ENTITIES),
+            'type': xml_escape(layer['type'], _XML_ATTR_ENTITIES),
+            'geometry': "Point" if layer['type'] == "vector" else "",
+            'id_text': xml_escape(layer_id),
+            'pipe': pipe if layer.get('style') else "",
+        }
+        tree_layers.append(tree_template.format_map(attrs))
+        order_items.append(item_template.format_map(attrs))
+        legend_layers.append(legend_template.format_map(attrs))
+        map_layers.append(map_template.format_map(attrs))
+    return tree_layers, order_items, legend_layers, map_layers
+
+def _project_fragments_from_tree(layers, pretty=False):
+    """
+    Monta os trechos XML das camadas com ElementTree (projetos com muitas camadas).
     
-    # Mapas de propriedades
-    mapcanvas_items = ET.SubElement(root, "mapcanvas-items")
+    Args:
+        layers (list): Lista de dicionários com informações de camadas
+        pretty (bool): Se True, indenta os trechos
+        
+    Returns:
+        tuple: Listas de trechos (árvore, ordem, legenda, camadas do mapa)
+    """
+    tree_layers, order_items, legend_layers, map_layers = [], [], [], []
     
-    # Legendas
-    legendlayers = ET.SubElement(root, "legendlayers")
+    # Referências locais para as funções usadas a cada camada
+    Element, SE, deepcopy, fragment = ET.Element, ET.SubElement, copy.deepcopy, _xml_fragment
     
-    # Lista de camadas
     for i, layer in enumerate(layers):
-        layer_id = f"layer_{i+1}_{os.path.basename(layer['path']).split('.')[0]}"
+        layer_id = _layer_id(i, layer['path'])
         
         # Criar elemento de camada na árvore
-        layer_tree_layer = ET.SubElement(layer_tree_group, "layer-tree-layer")
-        layer_tree_layer.set("id", layer_id)
-        layer_tree_layer.set("name", layer['name'])
-        layer_tree_layer.set("checked", "Qt::Checked")
-        layer_tree_layer.set("expanded", "1")
-        layer_tree_layer.set("source", layer['path'])
+        layer_tree_layer = Element("layer-tree-layer", {
+            "id": layer_id,
+            "name": layer['name'],
+            "checked": "Qt::Checked",
+            "expanded": "1",
+            "source": layer['path'],
+        })
+        tree_layers.append(fragment(layer_tree_layer, 2, pretty))
         
         # Criar propriedades da camada
-        maplayer = ET.SubElement(root, "maplayer")
-        maplayer.set("type", layer['type'])
-        maplayer.set("geometry", "Point" if layer['type'] == "vector" else "")
-        maplayer.set("id", layer_id)
-        maplayer.set("name", layer['name'])
-        maplayer.set("readOnly", "0")
+        maplayer = Element("maplayer", {
+            "type": layer['type'],
+            "geometry": "Point" if layer['type'] == "vector" else "",
+            "id": layer_id,
+            "name": layer['name'],
+            "readOnly": "0",
+        })
         
-        # Definir CRS da camada
-        layercrs = ET.SubElement(maplayer, "srs")
-        lspatialrefsys = ET.SubElement(layercrs, "spatialrefsys")
-        ET.SubElement(lspatialrefsys, "wkt").text = "GEOGCS[\"WGS 84\",DATUM[\"WGS_1984\",SPHEROID[\"WGS 84\",6378137,298.257223563]],PRIMEM[\"Greenwich\",0],UNIT[\"degree\",0.0174532925199433]]"
-        ET.SubElement(lspatialrefsys, "proj4").text = "+proj=longlat +datum=WGS84 +no_defs"
-        ET.SubElement(lspatialrefsys, "srsid").text = "3452"
-        ET.SubElement(lspatialrefsys, "srid").text = "4326"
-        ET.SubElement(lspatialrefsys, "authid").text = "EPSG:4326"
+        # Definir CRS da camada (cópia do bloco WGS 84 pré-montado)
+        maplayer.append(deepcopy(_LAYER_SRS))
         
         # Se houver estilo, adicionar referência
         if 'style' in layer and layer['style']:
-            pipe = ET.SubElement(maplayer, "pipe")
-            renderer = ET.SubElement(pipe, "renderer-v2")
-            renderer.set("type", "singleSymbol")
+            pipe = SE(maplayer, "pipe")
+            SE(pipe, "renderer-v2", {"type": "singleSymbol"})
             # Mais elementos de estilo poderiam ser adicionados aqui
+        map_layers.append(fragment(maplayer, 1, pretty))
         
         # Adicionar à legenda
-        legendlayer = ET.SubElement(legendlayers, "legendlayer")
-        legendlayer.set("open", "true")
-        legendlayer.set("checked", "Qt::Checked")
-        legendlayer.set("name", layer['name'])
-        legendlayer.set("showFeatureCount", "0")
+        legendlayer = Element("legendlayer", {
+            "open": "true",
+            "checked": "Qt::Checked",
+            "name": layer['name'],
+            "showFeatureCount": "0",
+        })
+        legend_layers.append(fragment(legendlayer, 2, pretty))
         
         # Referência na ordem de camadas
-        item = ET.SubElement(custom_order, "item")
+        item = Element("item")
         item.text = layer_id
+        order_items.append(fragment(item, 3, pretty))
     
-    # Converter XML para string formatada
-    xmlstr = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
+    return tree_layers, order_items, legend_layers, map_layers
+
+def create_qgis_project_file(layers, output_file="amazon_project.qgs", 
+                            title="Projeto Amazônia GAIA DIGITAL", output_dir=None, pretty=False):
+    """
+    Cria um arquivo de projeto QGIS completo com as camadas especificadas.
     
-    # Salvar para arquivo
-    temp_dir = tempfile.gettempdir()
-    filepath = os.path.join(temp_dir, output_file)
-    with open(filepath, 'w') as f:
-        f.write(xmlstr)
+    Args:
+        layers (list): Lista de dicionários com informações de camadas
+                       Cada camada deve ter: 'path', 'name', 'type', e opcionalmente 'style'
+        output_file (str): Nome do arquivo de projeto
+        title (str): Título do projeto
+        output_dir (str): Diretório de saída (None = diretório temporário do sistema)
+        pretty (bool): Se True, indenta o XML para leitura humana; o padrão é
+                       XML compacto (o QGIS não precisa da indentação)
+        
+    Returns:
+        str: Caminho do arquivo de projeto QGIS criado
+    """
+    filepath = os.path.join(output_dir or tempfile.gettempdir(), output_file)
+    
+    # Abertura do projeto: apenas título e versão variam
+    root_open = f'<qgis projectname="{xml_escape(title, _XML_ATTR_ENTITIES)}" version="3.22.0-Białowieża">'
+    if pretty:
+        root_open += "\n"
+    
+    # Fragmentos por camada, agrupados pela seção do projeto em que entram
+    if len(layers) <= _FAST_PATH_MAX_LAYERS:
+        fragments = _project_fragments_from_templates(layers, pretty)
+    else:
+        fragments = _project_fragments_from_tree(layers, pretty)
+    tree_layers, order_items, legend_layers, map_layers = fragments
+    sections = _PROJECT_SECTIONS[pretty]
+    
+    # Salvar para arquivo com uma única chamada, gravando os trechos na ordem
+    # do documento (sem montar o XML completo em uma única string)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.writelines([
+            _PROJECT_DECLARATION,
+            root_open,
+            sections[0],
+            *tree_layers,
+            sections[1],
+            *order_items,
+            sections[2],
+            *legend_layers,
+            sections[3],
+            *map_layers,
+            sections[4],
+        ])
     
     return filepath
 
+# Formatos já comprimidos: armazenados sem nova compressão no ZIP
+_ZIP_STORED_EXTENSIONS = {'.tif', '.tiff', '.laz', '.zip', '.qgz', '.gz', '.png', '.jpg', '.jpeg'}
+
+# Arquivos a partir deste tamanho são copiados para o ZIP em blocos maiores
+_ZIP_CHUNKED_MIN_SIZE = 16 << 20
+_ZIP_CHUNK_SIZE = 1 << 20
+
+def _zip_add(zipf, filepath):
+    """
+    Adiciona um arquivo à raiz do ZIP, comprimindo-o apenas se ainda não for
+    um formato comprimido.
+    
+    Args:
+        zipf (zipfile.ZipFile): Arquivo ZIP aberto para escrita
+        filepath (str): Caminho do arquivo a adicionar
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    compress_type = zipfile.ZIP_STORED if extension in _ZIP_STORED_EXTENSIONS else zipf.compression
+    
+    zinfo = zipfile.ZipInfo.from_file(filepath, arcname=os.path.basename(filepath))
+    zinfo.compress_type = compress_type
+    # Nível de compressão explícito no membro só é público (ZipInfo.compress_level)
+    # a partir do Python 3.13; antes disso, apenas ZipFile.write o aplica
+    needs_level = compress_type != zipfile.ZIP_STORED and zipf.compresslevel is not None
+    if zinfo.file_size < _ZIP_CHUNKED_MIN_SIZE or (needs_level and not hasattr(zinfo, 'compress_level')):
+        zipf.write(filepath, arcname=zinfo.filename, compress_type=compress_type)
+        return
+    
+    # Arquivos grandes: cópia em blocos de 1 MiB (ZipFile.write usa 8 KiB),
+    # mantendo data e permissões do arquivo original (ZipInfo.from_file)
+    if needs_level:
+        zinfo.compress_level = zipf.compresslevel
+    with open(filepath, 'rb', buffering=_ZIP_CHUNK_SIZE) as src, zipf.open(zinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, length=_ZIP_CHUNK_SIZE)
+
 def create_qgis_project_package(layers, output_file="amazon_project.qgz", 
                                title="Projeto Amazônia GAIA DIGITAL"):
     """
@@ -346,34 +581,54 @@ def create_qgis_project_package(layers, output_file="amazon_project.qgz",
     Returns:
         str: Caminho do arquivo de pacote QGIS criado
     """
-    # Criar diretório temporário para o pacote
-    temp_dir = tempfile.mkdtemp()
     project_base_name = output_file.replace('.qgz', '')
     
-    # Criar arquivo de projeto QGIS
-    project_file = create_qgis_project_file(layers, f"{project_base_name}.qgs", title)
-    
     # Criar arquivo zipado (.qgz)
     temp_qgz = os.path.join(tempfile.gettempdir(), output_file)
     
-    with zipfile.ZipFile(temp_qgz, 'w') as zipf:
+    # O .qgs só é necessário até entrar no pacote: diretório removido ao final
+    with tempfile.TemporaryDirectory() as workdir, \
+         zipfile.ZipFile(temp_qgz, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+        # Criar arquivo de projeto QGIS
+        project_file = create_qgis_project_file(layers, f"{project_base_name}.qgs", title, output_dir=workdir)
+        
         # Adicionar arquivo de projeto
-        zipf.write(project_file, arcname=os.path.basename(project_file))
+        _zip_add(zipf, project_file)
         
         # Adicionar camadas e estilos
         for layer in layers:
             # Adicionar arquivo da camada
             layer_file = layer['path']
-            zipf.write(layer_file, arcname=os.path.basename(layer_file))
+            _zip_add(zipf, layer_file)
             
             # Adicionar estilo se existir
             if 'style' in layer and layer['style']:
                 style_file = layer['style']
-                zipf.write(style_file, arcname=os.path.basename(style_file))
+                _zip_add(zipf, style_file)
     
     return temp_qgz
 
-def prepare_export_files(files_dict):
+# Texto fixo do README do pacote (antes e depois da lista de arquivos)
+_README_HEADER = """GAIA DIGITAL - Pacote de Dados Geoespaciais para QGIS
+===================================================
+
+Este pacote contém arquivos para análise geoespacial da Amazônia no QGIS.
+
+ARQUIVOS INCLUÍDOS:
+------------------
+"""
+
+_README_FOOTER = """
+INSTRUÇÕES:
+----------
+1. Extraia todos os arquivos para um diretório
+2. Abra o arquivo de projeto QGIS (.qgs)
+3. Se necessário, ajuste os caminhos das camadas no QGIS
+
+Este pacote foi gerado pelo aplicativo GAIA DIGITAL para análise geoespacial amazônica.
+"""
+
+def prepare_export_files(files_dict, workdir=None):
     """
     Prepara todos os arquivos para exportação, criando um arquivo ZIP.
     
@@ -384,138 +639,129 @@ def prepare_export_files(files_dict):
                             'points': 'path/to/points.geojson',
                             'raster': 'path/to/elevation.tif'
                         }
+        workdir (str): Diretório para os intermediários (projeto e estilos QML);
+                       None = diretório temporário removido ao final
         
     Returns:
         str: Caminho do arquivo ZIP criado
     """
-    # Criar diretório temporário
-    temp_dir = tempfile.mkdtemp()
-    
-    # Nome do arquivo ZIP
-    temp_zip = os.path.join(tempfile.gettempdir(), "gaia_digital_qgis_export.zip")
-    
-    # Criar metadados para o pacote
-    metadata = {
-        "project": "GAIA DIGITAL",
-        "description": "Análise geoespacial da Amazônia",
-        "files": [],
-        "instructions": {
-            "pt_BR": "Abra o arquivo de projeto QGIS para visualizar todas as camadas configuradas.",
-            "en_US": "Open the QGIS project file to view all configured layers."
-        }
-    }
-    
-    # Listar camadas para o projeto QGIS
-    qgis_layers = []
-    
-    # Processar cada arquivo
-    for key, filepath in files_dict.items():
-        if not filepath or not os.path.exists(filepath):
-            continue
+    # Projeto e estilos intermediários em um diretório de trabalho, removido ao final se for temporário
+    with (tempfile.TemporaryDirectory() if workdir is None else contextlib.nullcontext(workdir)) as workdir:
+        # Nome do arquivo ZIP
+        temp_zip = os.path.join(tempfile.gettempdir(), "gaia_digital_qgis_export.zip")
         
-        filename = os.path.basename(filepath)
-        file_info = {
-            "name": filename,
-            "type": key,
-            "path": filename  # Caminho relativo dentro do ZIP
+        # Criar metadados para o pacote
+        metadata = {
+            "project": "GAIA DIGITAL",
+            "description": "Análise geoespacial da Amazônia",
+            "files": [],
+            "instructions": {
+                "pt_BR": "Abra o arquivo de projeto QGIS para visualizar todas as camadas configuradas.",
+                "en_US": "Open the QGIS project file to view all configured layers."
+            }
         }
         
-        # Adicionar ao metadados
-        metadata["files"].append(file_info)
+        # Listar camadas para o projeto QGIS (e arquivos que não são camadas)
+        qgis_layers = []
+        extra_files = []
         
-        # Configurar camada QGIS
-        if key == "lidar":
-            # Criar estilo para LiDAR
-            style_path = create_lidar_style_file(filepath)
-            qgis_layers.append({
-                'path': filepath,
-                'name': "Dados LiDAR",
-                'type': "delimitedtext",
-                'style': style_path
-            })
-            file_info["style"] = os.path.basename(style_path)
-        elif key == "points":
-            # Criar estilo para pontos com ícone de caravela
-            style_path = create_qgis_style_file(filepath, "ship")
-            qgis_layers.append({
-                'path': filepath,
-                'name': "Pontos de Interesse",
-                'type': "vector",
-                'style': style_path
-            })
-            file_info["style"] = os.path.basename(style_path)
-        elif key == "raster":
-            # Criar estilo para raster de elevação
-            style_path = create_elevation_style_file(filepath)
-            qgis_layers.append({
-                'path': filepath,
-                'name': "Modelo Digital de Elevação",
-                'type': "raster",
-                'style': style_path
-            })
-            file_info["style"] = os.path.basename(style_path)
-    
-    # Criar projeto QGIS
-    if qgis_layers:
-        project_file = create_qgis_project_file(qgis_layers, "amazonia_gaia_digital.qgs")
-        project_info = {
-            "name": os.path.basename(project_file),
-            "type": "qgis_project",
-            "path": os.path.basename(project_file)
-        }
-        metadata["files"].append(project_info)
-    
-    # Salvar metadados
-    metadata_file = os.path.join(temp_dir, "metadata.json")
-    with open(metadata_file, 'w') as f:
-        json.dump(metadata, f, indent=2)
-    
-    # Criar README
-    readme_file = os.path.join(temp_dir, "README.txt")
-    with open(readme_file, 'w') as f:
-        f.write(f"""GAIA DIGITAL - Pacote de Dados Geoespaciais para QGIS
-===================================================
-
-Este pacote contém arquivos para análise geoespacial da Amazônia no QGIS.
-
-ARQUIVOS INCLUÍDOS:
-------------------
-""")
+        # Processar cada arquivo
+        for key, filepath in files_dict.items():
+            if not filepath or not os.path.exists(filepath):
+                continue
+            
+            filename = os.path.basename(filepath)
+            file_info = {
+                "name": filename,
+                "type": key,
+                "path": filename  # Caminho relativo dentro do ZIP
+            }
+            
+            # Adicionar ao metadados
+            metadata["files"].append(file_info)
+            
+            # Configurar camada QGIS
+            if key == "lidar":
+                # Criar estilo para LiDAR
+                style_path = create_lidar_style_file(filepath, output_dir=workdir)
+                qgis_layers.append({
+                    'path': filepath,
+                    'name': "Dados LiDAR",
+                    'type': "delimitedtext",
+                    'style': style_path
+                })
+                file_info["style"] = os.path.basename(style_path)
+            elif key == "points":
+                # Criar estilo para pontos com ícone de caravela
+                style_path = create_qgis_style_file(filepath, "ship", output_dir=workdir)
+                qgis_layers.append({
+                    'path': filepath,
+                    'name': "Pontos de Interesse",
+                    'type': "vector",
+                    'style': style_path
+                })
+                file_info["style"] = os.path.basename(style_path)
+            elif key == "raster":
+                # Criar estilo para raster de elevação
+                style_path = create_elevation_style_file(filepath, output_dir=workdir)
+                qgis_layers.append({
+                    'path': filepath,
+                    'name': "Modelo Digital de Elevação",
+                    'type': "raster",
+                    'style': style_path
+                })
+                file_info["style"] = os.path.basename(style_path)
+            else:
+                extra_files.append(filepath)
         
-        # Listar todos os arquivos incluídos
-        for file_info in metadata["files"]:
-            f.write(f"- {file_info['name']} ({file_info['type']})\n")
-            if "style" in file_info:
-                f.write(f"  Estilo: {file_info['style']}\n")
+        # Criar projeto QGIS
+        if qgis_layers:
+            project_file = create_qgis_project_file(qgis_layers, "amazonia_gaia_digital.qgs", output_dir=workdir)
+            project_info = {
+                "name": os.path.basename(project_file),
+                "type": "qgis_project",
+                "path": os.path.basename(project_file)
+            }
+            metadata["files"].append(project_info)
         
-        f.write("""
-INSTRUÇÕES:
-----------
-1. Extraia todos os arquivos para um diretório
-2. Abra o arquivo de projeto QGIS (.qgs)
-3. Se necessário, ajuste os caminhos das camadas no QGIS
-
-Este pacote foi gerado pelo aplicativo GAIA DIGITAL para análise geoespacial amazônica.
-""")
-    
-    # Criar arquivo ZIP com todos os arquivos
-    with zipfile.ZipFile(temp_zip, 'w') as zipf:
-        # Adicionar metadados e README
-        zipf.write(metadata_file, arcname=os.path.basename(metadata_file))
-        zipf.write(readme_file, arcname=os.path.basename(readme_file))
+        # Metadados e README são gerados em memória e gravados direto no ZIP
+        metadata_bytes = orjson.dumps(metadata, option=orjson.OPT_INDENT_2)
         
-        # Adicionar todos os arquivos de dados e estilos
-        for key, filepath in files_dict.items():
-            if filepath and os.path.exists(filepath):
-                zipf.write(filepath, arcname=os.path.basename(filepath))
-                
-                # Adicionar arquivo de estilo se existir
-                style_path = f"{filepath}.qml"
-                if os.path.exists(style_path):
-                    zipf.write(style_path, arcname=os.path.basename(style_path))
+        readme_parts = [_README_HEADER]
+        for file_info in metadata["files"]:
+            readme_parts.append(f"- {file_info['name']} ({file_info['type']})\n")
+            if "style" in file_info:
+                readme_parts.append(f"  Estilo: {file_info['style']}\n")
+        readme_parts.append(_README_FOOTER)
+        readme_bytes = "".join(readme_parts).encode('utf-8')
         
-        # Adicionar projeto QGIS
-        if qgis_layers:
-            zipf.write(project_file, arcname=os.path.basename(project_file))
+        # Criar arquivo ZIP com todos os arquivos
+        with zipfile.ZipFile(temp_zip, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+            # Adicionar metadados e README, com a data do empacotamento e as
+            # mesmas permissões dos arquivos gravados em disco
+            zip_date = time.localtime()[:6]
+            for name, data in (("metadata.json", metadata_bytes), ("README.txt", readme_bytes)):
+                zinfo = zipfile.ZipInfo(name, zip_date)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zinfo.external_attr = 0o644 << 16  # Permissões -rw-r--r--
+                zipf.writestr(zinfo, data, compresslevel=zipf.compresslevel)
+            
+            # Adicionar cada arquivo de dados e estilo uma única vez (as camadas
+            # já registram seus estilos; nomes repetidos são ignorados)
+            seen = set()
+            package_files = [path for layer in qgis_layers for path in (layer['path'], layer['style'])]
+            for filepath in package_files + extra_files:
+                arcname = os.path.basename(filepath)
+                if arcname not in seen:
+                    seen.add(arcname)
+                    try:
+                        _zip_add(zipf, filepath)
+                    except FileNotFoundError:
+                        # Arquivo removido depois de listado: segue sem ele
+                        pass
+            
+            # Adicionar projeto QGIS
+            if qgis_layers:
+                _zip_add(zipf, project_file)
     
     return temp_zip
@@ -1,9 +1,476 @@
+import os
+import re
+import logging
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from dataclasses import dataclass
+import orjson
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+
+from utils.gemini_api import GEMINI_MODEL, ExactMatchCache, JSONArrayScanner, SemanticCache
+
+_LOG = logging.getLogger(__name__)
+
+@dataclass(frozen=True, slots=True)
+class Coordinate:
+    """
+    Ponto extraído do texto.
+    
+    Os resultados mantidos nos caches são tuplas de Coordinate, menores que
+    listas de dicionários; a API pública devolve dicionários (ver to_dict).
+    """
+    lat: float
+    lon: float
+    name: str
+    type: str
+    semantic_weight: float = 0.0
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Cria a coordenada a partir de um objeto JSON, ignorando chaves extras."""
+        return cls(
+            float(data["lat"]),
+            float(data["lon"]),
+            str(data.get("name", "")),
+            str(data.get("type", "")),
+            float(data.get("semantic_weight", 0.0))
+        )
+    
+    def to_dict(self):
+        """Retorna a coordenada como dicionário (formato usado pelo Streamlit/Folium)."""
+        return {
+            "lat": self.lat,
+            "lon": self.lon,
+            "name": self.name,
+            "type": self.type,
+            "semantic_weight": self.semantic_weight
+        }
+
+# Versão do prompt de extração: alterá-la invalida as entradas do cache exato
+_PROMPT_VERSION = "2"
+
+# Modelo do prompt de extração, montado só quando há falta nos caches
+_EXTRACTION_PROMPT_TEMPLATE = """Extraia coordenadas geodésicas precisas do texto (Amazônia Legal).
+
+TEXTO: "{text}"
+
+ETAPAS:
+1. Núcleos nominais/verbais, modificadores espaciais e preposicionais de local.
+2. Entidades: bairros, ruas, prédios, relevos, rios, áreas naturais, cidades, direções; confiança 0-1.
+3. Coordenadas por entidade com pertinência fuzzy 0-1, raio de dispersão e relevância.
+4. Funda entidades próximas; elimine outliers (específico>genérico, direto>indireto).
+5. Valide no contexto; atribua tipo semântico e nome descritivo.
+
+Responda SOMENTE com um array JSON:
+[{{"lat": float, "lon": float, "name": str, "type": str, "semantic_weight": 0.0-1.0}}]"""
+
+# Expressões de cortesia/pedido que não alteram o local descrito; são removidas
+# antes do embedding para que "por favor, mostre Manaus" e "mostre Manaus"
+# caiam na mesma entrada do cache semântico
+_FILLER_RE = re.compile(
+    r"\b(?:por favor|me diga|me mostre|gostaria de|eu quero|quero|"
+    r"voc[eê] (?:pode|poderia)|poderia|pode)\b[\s,]*",
+    re.IGNORECASE
+)
+
+def _canonicalize_text(text):
+    """Remove expressões de preenchimento e normaliza espaços (a caixa é
+    mantida: a assinatura do cache semântico usa as maiúsculas dos nomes)."""
+    return " ".join(_FILLER_RE.sub(" ", text).split())
+
+def _request_key(text):
+    """SHA-256 do texto (NFC, sem espaços nas bordas), da versão do prompt e do modelo."""
+    normalized = unicodedata.normalize("NFC", text).strip()
+    payload = "\x00".join((normalized, _PROMPT_VERSION, GEMINI_MODEL.lower()))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SQLiteCache:
+    """
+    Cache persistente em SQLite, compartilhado entre sessões e processos.
+    
+    Os valores são gravados como JSON (orjson); entradas expiram após `ttl`
+    segundos e, acima de `max_entries`, as menos acessadas recentemente são
+    removidas. Se o banco não puder ser aberto, o cache fica desativado.
+    """
+    
+    def __init__(self, path, ttl=86400, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = None
+        self._enabled = True
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        """Abre o banco na primeira utilização, ou retorna None se indisponível."""
+        if self._conn is None and self._enabled:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                    "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+                conn.commit()
+                self._conn = conn
+            except (OSError, sqlite3.Error) as e:
+                _LOG.warning("Cache persistente desativado: %s", e)
+                self._enabled = False
+        return self._conn
+    
+    def get(self, key):
+        """Retorna o valor em cache para a chave, ou None se ausente/expirado."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                return orjson.loads(row[0])
+            except sqlite3.Error as e:
+                _LOG.warning("Erro ao ler o cache persistente: %s", e)
+                return None
+    
+    def set(self, key, value):
+        """Armazena um valor, removendo as entradas excedentes menos acessadas."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            now = time.time()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, orjson.dumps(value), now, now)
+                )
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                    "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                _LOG.warning("Erro ao gravar no cache persistente: %s", e)
+
+_CACHE_DB_PATH = os.path.join(os.path.expanduser("~"), ".cache", "jesusqgis", "gemini.db")
+
+# --------- GAZETTEER LOCAL ---------
+# Locais frequentes da Amazônia (coordenadas da base de referência do
+# app_semantico). Chaves em minúsculas e sem acentos; valor: (lat, lon, nome, tipo)
+AMAZON_PLACES = {
+    "manaus": (-3.1190275, -60.0217314, "Manaus", "cidade"),
+    "belem": (-1.4557, -48.4902, "Belém", "cidade"),
+    "santarem": (-2.4431, -54.7083, "Santarém", "cidade"),
+    "macapa": (0.0349, -51.0694, "Macapá", "cidade"),
+    "boa vista": (2.8206, -60.6718, "Boa Vista", "cidade"),
+    "porto velho": (-8.7612, -63.9039, "Porto Velho", "cidade"),
+    "tefe": (-3.3528, -64.7108, "Tefé", "cidade"),
+    "tabatinga": (-4.2411, -69.9386, "Tabatinga", "cidade"),
+    "itacoatiara": (-3.1378, -58.4443, "Itacoatiara", "cidade"),
+    "presidente figueiredo": (-2.0290, -60.0237, "Presidente Figueiredo", "cidade"),
+    "rio negro": (-3.0581, -60.0894, "Rio Negro", "rio"),
+    "rio solimoes": (-3.3222, -60.6347, "Rio Solimões", "rio"),
+    "solimoes": (-3.3222, -60.6347, "Rio Solimões", "rio"),
+    "rio amazonas": (-3.3791, -58.7455, "Rio Amazonas", "rio"),
+    "rio madeira": (-3.4572, -58.7889, "Rio Madeira", "rio"),
+    "rio purus": (-3.7503, -61.4722, "Rio Purus", "rio"),
+    "encontro das aguas": (-3.1414, -59.8833, "Encontro das Águas", "rio"),
+    "reserva ducke": (-2.9322, -59.9811, "Reserva Florestal Adolpho Ducke", "floresta"),
+    "reserva florestal adolpho ducke": (-2.9322, -59.9811, "Reserva Florestal Adolpho Ducke", "floresta"),
+    "anavilhanas": (-2.7070, -60.7450, "Anavilhanas", "ilha"),
+    "arquipelago de anavilhanas": (-2.5985, -60.9464, "Arquipélago de Anavilhanas", "ilha"),
+    "parque nacional do jau": (-1.8508, -61.6228, "Parque Nacional do Jaú", "floresta"),
+    "reserva mamiraua": (-2.3514, -66.7114, "Reserva Mamirauá", "floresta"),
+    "serra do divisor": (-7.4389, -73.7883, "Serra do Divisor", "relevo"),
+    "monte roraima": (5.1387, -60.8128, "Monte Roraima", "relevo"),
+    "ilha de marajo": (-0.7889, -49.5261, "Ilha de Marajó", "ilha"),
+    "marajo": (-0.7889, -49.5261, "Ilha de Marajó", "ilha"),
+    "balbina": (-1.9161, -59.4735, "Hidrelétrica de Balbina", "infraestrutura"),
+    "am 010": (-2.7084, -59.6977, "Rodovia AM-010", "infraestrutura"),
+    "ponta negra": (-3.0665, -60.0981, "Ponta Negra", "bairro"),
+}
+_GAZETTEER_MAX_WORDS = max(len(name.split()) for name in AMAZON_PLACES)
+# Fração mínima das palavras de conteúdo coberta pelo gazetteer para dispensar a API
+_GAZETTEER_MIN_COVERAGE = 0.8
+_WORD_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset({
+    "a", "o", "as", "os", "e", "de", "da", "do", "das", "dos", "em", "na", "no",
+    "nas", "nos", "ao", "aos", "entre", "perto", "proximo", "regiao", "area",
+    "mostre", "mapa", "local", "locais"
+})
+
+def _strip_accents(text):
+    """Remove acentos (decomposição NFKD sem os caracteres combinantes)."""
+    return "".join(
+        ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch)
+    )
+
+def _gazetteer_lookup(text):
+    """
+    Resolve textos curtos compostos apenas de locais conhecidos, sem a API.
+    
+    Os nomes do gazetteer são procurados palavra a palavra (maior nome
+    primeiro); se cobrirem mais de 80% das palavras de conteúdo do texto, as
+    coordenadas correspondentes são devolvidas na ordem em que aparecem.
+    
+    Args:
+        text (str): Texto com descrição geográfica
+        
+    Returns:
+        tuple: Coordinate encontradas, ou None se o texto não estiver coberto
+    """
+    words = _WORD_RE.findall(_strip_accents(_canonicalize_text(text).lower()))
+    content = sum(1 for w in words if w not in _STOPWORDS)
+    if content == 0:
+        return None
+    
+    places = {}
+    covered = 0
+    i = 0
+    while i < len(words):
+        for n in range(min(_GAZETTEER_MAX_WORDS, len(words) - i), 0, -1):
+            place = AMAZON_PLACES.get(" ".join(words[i:i + n]))
+            if place is not None:
+                places.setdefault(place[2], place)
+                covered += sum(1 for w in words[i:i + n] if w not in _STOPWORDS)
+                i += n
+                break
+        else:
+            i += 1
+    
+    if not places or covered / content <= _GAZETTEER_MIN_COVERAGE:
+        return None
+    return tuple(
+        Coordinate(lat, lon, name, place_type, 1.0)
+        for lat, lon, name, place_type in places.values()
+    )
+
+# L1: texto idêntico (reexecuções do Streamlit), em memória e em disco;
+# L2: paráfrases
+_exact_cache = ExactMatchCache(ttl=3600, max_entries=1024)
+_persistent_cache = SQLiteCache(_CACHE_DB_PATH)
+_semantic_cache = SemanticCache(threshold=0.90)
+
+# Sessão do módulo: as consultas reaproveitam a conexão TCP/TLS (keep-alive)
+_HTTP_TIMEOUT = (3, 30)  # (conexão, leitura) em segundos
+# Streaming (SSE): o array é lido à medida que chega e a conexão é encerrada
+# assim que ele se fecha, sem aguardar o fim da geração
+_GEMINI_STREAM_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+_SESSION = requests.Session()
+_SESSION.headers.update({'Content-Type': 'application/json'})
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
+# Falhas transitórias (429/5xx, timeouts) são repetidas com espera exponencial
+_MAX_ATTEMPTS = 3
+_BACKOFF_BASE = 1.0   # segundos
+_BACKOFF_MAX = 8.0    # segundos
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+def _backoff_delay(attempt, response=None):
+    """
+    Tempo de espera antes da próxima tentativa.
+    
+    Args:
+        attempt (int): Número da tentativa que falhou (a partir de 0)
+        response (requests.Response): Resposta com erro, se houver
+        
+    Returns:
+        float: Segundos de espera, respeitando Retry-After quando informado
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return min(_BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+    return min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt + random.uniform(0, 1))
+
+class CircuitBreaker:
+    """
+    Interrompe as chamadas à API após falhas consecutivas.
+    
+    Depois de `threshold` consultas seguidas sem sucesso, novas consultas são
+    recusadas por `cooldown` segundos (o chamador usa o resultado padrão);
+    passado esse prazo, uma única consulta de teste é liberada e as demais
+    continuam recusadas até que ela tenha sucesso ou um novo prazo termine.
+    """
+    
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """Indica se uma consulta pode ser feita agora."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.cooldown:
+                return False
+            # Meio-aberto: reinicia o prazo para liberar apenas esta consulta
+            self._opened_at = now
+            return True
+    
+    def record_success(self):
+        """Zera a contagem de falhas e fecha o circuito."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+    
+    def record_failure(self):
+        """Conta uma falha, abrindo o circuito ao atingir o limite."""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+_circuit_breaker = CircuitBreaker()
+
+# Abaixo disso o Timsort com chave em Python é mais rápido que o argsort
+_ARGSORT_MIN_ITEMS = 8
+
+def _sort_by_weight(coordinates):
+    """
+    Ordena as coordenadas por peso semântico decrescente (ordenação estável).
+    
+    Args:
+        coordinates (list): Objetos Coordinate
+        
+    Returns:
+        list: Nova lista ordenada
+    """
+    if len(coordinates) < _ARGSORT_MIN_ITEMS:
+        return sorted(coordinates, key=lambda c: c.semantic_weight, reverse=True)
+    weights = np.fromiter(
+        (c.semantic_weight for c in coordinates),
+        dtype=np.float64, count=len(coordinates)
+    )
+    order = np.argsort(-weights, kind="stable")
+    return [coordinates[i] for i in order]
+
+def _read_streamed_array(response):
+    """
+    Lê uma resposta SSE da API Gemini até o primeiro array JSON se fechar.
+    
+    Args:
+        response (requests.Response): Resposta aberta com stream=True
+        
+    Returns:
+        str: Texto do array JSON, ou None se a resposta terminar sem ele
+    """
+    scanner = JSONArrayScanner()
+    for line in response.iter_lines():
+        # Cada evento SSE traz um objeto GenerateContentResponse parcial
+        if not line.startswith(b"data:"):
+            continue
+        event = orjson.loads(line[5:])
+        for candidate in event.get("candidates", [])[:1]:
+            for part in candidate.get("content", {}).get("parts", []):
+                if "text" in part:
+                    array_text = scanner.feed(part["text"])
+                    if array_text is not None:
+                        return array_text
+    _LOG.warning("Array JSON não encontrado na resposta.")
+    return None
+
+# Esquema da resposta: com responseMimeType JSON o modelo devolve apenas o
+# array, que é lido diretamente, sem procurar o JSON no meio do texto
+_COORDINATES_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "lat": {"type": "NUMBER"},
+            "lon": {"type": "NUMBER"},
+            "name": {"type": "STRING"},
+            "type": {"type": "STRING"},
+            "semantic_weight": {"type": "NUMBER"}
+        },
+        "required": ["lat", "lon", "name", "type", "semantic_weight"]
+    }
+}
+
 def extract_geo_entities_semantic(text, gemini_api_key):
+    """
+    Extrai coordenadas geográficas do texto com cache exato e semântico.
+    
+    Textos compostos apenas de locais conhecidos são resolvidos pelo
+    gazetteer local (AMAZON_PLACES). Um texto idêntico a uma consulta recente
+    é resolvido pelo hash SHA-256, sem calcular embedding, primeiro em memória
+    e depois no cache SQLite compartilhado (~/.cache/jesusqgis/gemini.db);
+    descrições parafraseadas (similaridade de cosseno >= 0.90 após remover
+    expressões de preenchimento) reutilizam a lista de coordenadas já
+    ordenada. Em todos esses casos não há nova chamada à API Gemini.
+    
+    Args:
+        text (str): Texto com descrição geográfica para análise
+        gemini_api_key (str): Chave de API Gemini para processamento
+        
+    Returns:
+        list: Lista de coordenadas geográficas com alta precisão
+    """
+    return [c.to_dict() for c in _lookup_coordinates(text, gemini_api_key)]
+
+def _lookup_coordinates(text, gemini_api_key):
+    """Percorre gazetteer e caches antes de consultar a API; retorna tupla de Coordinate."""
+    # Entradas triviais ("Manaus", "Rio Negro e Solimões") dispensam a API
+    coordinates = _gazetteer_lookup(text)
+    if coordinates is not None:
+        return coordinates
+    
+    key = _request_key(text)
+    coordinates = _exact_cache.get(key)
+    if coordinates is not None:
+        return coordinates
+    
+    stored = _persistent_cache.get(key)
+    if stored is not None:
+        coordinates = tuple(Coordinate.from_dict(c) for c in stored)
+        _exact_cache.set(key, coordinates)
+        return coordinates
+    
+    coordinates = _semantic_cache.get_or_set(
+        _canonicalize_text(text),
+        lambda _: _extract_geo_entities_uncached(text, gemini_api_key)
+    )
+    if coordinates:
+        _exact_cache.set(key, coordinates)
+        # orjson serializa dataclasses diretamente (lista de objetos JSON)
+        _persistent_cache.set(key, coordinates)
+    return coordinates
+
+def _extract_geo_entities_uncached(text, gemini_api_key):
     """
     Algoritmo avançado para extração semântica de entidades geográficas com lógica fuzzy
     e eliminação de dispersão por teoria de conjuntos.
     
-    Este algoritmo opera em camadas:
+    Este algoritmo opera em camadas, todas resolvidas numa única consulta à API:
     1. Decomposição semântica (núcleos nominais e verbais)
     2. Identificação de entidades geográficas específicas
     3. Análise de pertinência fuzzy com pesos
@@ -15,20 +482,12 @@ def extract_geo_entities_semantic(text, gemini_api_key):
         gemini_api_key (str): Chave de API Gemini para processamento
         
     Returns:
-        list: Lista de coordenadas geográficas com alta precisão
+        tuple: Coordinate ordenadas por peso semântico (vazia em caso de falha)
     """
-    import requests
-    import json
-    import re
-    import numpy as np
-    from collections import defaultdict
-    import base64
-    
     # Função auxiliar para consultar a API Gemini
-    def query_gemini_api(prompt, temperature=0.1):
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={gemini_api_key}"
-        
-        headers = {'Content-Type': 'application/json'}
+    def query_gemini_api(prompt, temperature=0):
+        # A chave vai no cabeçalho x-goog-api-key, fora da URL
+        headers = {'x-goog-api-key': gemini_api_key}
         data = {
             "contents": [
                 {
@@ -41,207 +500,98 @@ def extract_geo_entities_semantic(text, gemini_api_key):
             ],
             "generationConfig": {
                 "temperature": temperature,
-                "maxOutputTokens": 2048
+                "maxOutputTokens": 2048,
+                "responseMimeType": "application/json",
+                "responseSchema": _COORDINATES_SCHEMA
             }
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        if not _circuit_breaker.allow():
+            _LOG.warning("API Gemini indisponível após falhas consecutivas; consulta ignorada.")
+            return None
         
-        if response.status_code == 200:
-            result = response.json()
+        body = orjson.dumps(data)
+        for attempt in range(_MAX_ATTEMPTS):
+            last_attempt = attempt == _MAX_ATTEMPTS - 1
             try:
-                return result["candidates"][0]["content"]["parts"][0]["text"]
-            except (KeyError, IndexError) as e:
-                print(f"Erro ao processar resposta da API: {e}")
-                return None
-        else:
-            print(f"Erro na API Gemini: {response.status_code} - {response.text}")
-            return None
-    
-    # CAMADA 1: Decomposição semântica do texto
-    semantic_decomposition_prompt = f"""
-    Analise o seguinte texto e decomponha-o em suas partes semânticas:
-    
-    Texto: "{text}"
-    
-    Extraia:
-    1. Núcleos nominais (substantivos que indicam locais)
-    2. Núcleos verbais (verbos que indicam movimento ou posição)
-    3. Modificadores espaciais (adjetivos ou advérbios relacionados a locais)
-    4. Conjuntos preposicionais de localização (ex: "próximo a", "ao lado de")
-    
-    Retorne APENAS um objeto JSON no seguinte formato:
-    {{
-        "nominal_cores": ["lista de núcleos nominais"],
-        "verbal_cores": ["lista de núcleos verbais"],
-        "spatial_modifiers": ["lista de modificadores espaciais"],
-        "prepositional_sets": ["lista de conjuntos preposicionais"]
-    }}
-    """
-    
-    # CAMADA 2: Identificação de entidades geográficas específicas
-    geo_entities_prompt = f"""
-    Analise o seguinte texto e identifique TODAS as entidades geográficas específicas:
-    
-    Texto: "{text}"
-    
-    Categorize precisamente as entidades encontradas:
-    - Bairros (ex: "Laranjeiras", "Centro")
-    - Ruas/Avenidas (ex: "Avenida Paulista")
-    - Monumentos/Prédios (ex: "Teatro Amazonas")
-    - Relevos (ex: "Serra do Mar", "Pico da Neblina")
-    - Rios (ex: "Rio Negro", "Solimões")
-    - Áreas naturais (ex: "Parque Nacional")
-    - Cidades/Estados (ex: "Manaus", "Amazonas")
-    - Pontos cardeais e referências direcionais (ex: "norte de", "sudeste")
-    
-    IMPORTANTE: Indique para cada entidade um peso de confiança (0.0-1.0) baseado em quão específica e inequívoca ela é.
-    
-    Retorne APENAS um objeto JSON no seguinte formato:
-    {{
-        "entities": [
-            {{
-                "name": "nome da entidade",
-                "type": "tipo da entidade",
-                "confidence": valor de confiança (0.0-1.0),
-                "context": "contexto textual em que aparece"
-            }}
-        ]
-    }}
-    """
-    
-    # CAMADA 3: Análise fuzzy de coordenadas conhecidas
-    fuzzy_coordinates_prompt = f"""
-    Com base nas entidades geográficas identificadas no texto, determine as coordenadas geográficas mais prováveis:
-    
-    Texto: "{text}"
-    
-    Para cada entidade geográfica significativa:
-    1. Determine as coordenadas mais precisas (latitude, longitude)
-    2. Atribua um grau de pertinência (0.0-1.0) baseado em quão confiável é a determinação
-    3. Identifique o raio de dispersão aproximado (em km)
-    4. Determine a relevância contextual da entidade no texto (0.0-1.0)
-    
-    ATENÇÃO: Foque APENAS em entidades amazônicas. Considere contextos da Amazônia Legal brasileira.
-    
-    Retorne APENAS um objeto JSON no seguinte formato:
-    {{
-        "coordinates": [
-            {{
-                "entity": "nome da entidade",
-                "lat": latitude em graus decimais,
-                "lon": longitude em graus decimais,
-                "membership": valor fuzzy de pertinência (0.0-1.0),
-                "dispersion_radius": raio em km,
-                "contextual_relevance": relevância (0.0-1.0)
-            }}
-        ]
-    }}
-    """
-    
-    # CAMADA 4: Colapso de dados por teoria de conjuntos
-    set_theory_prompt = f"""
-    Com base na análise anterior, aplique teoria de conjuntos para eliminar redundâncias e resolver conflitos:
-    
-    Texto: "{text}"
-    
-    Quando múltiplas coordenadas se referem a entidades semanticamente relacionadas:
-    1. Identifique interseções por proximidade geográfica
-    2. Calcule o conjunto mínimo que mantém a fidelidade semântica
-    3. Elimine outliers baseado em distância e relevância contextual
-    4. Resolva conflitos utilizando regras de prioridade:
-       - Entidades específicas > entidades genéricas
-       - Referências diretas > referências indiretas
-       - Alta confiança > baixa confiança
-       - Contexto primário > contexto secundário
-    
-    Retorne APENAS um objeto JSON com coordenadas finais consolidadas:
-    {{
-        "consolidated_coordinates": [
-            {{
-                "entity": "nome da entidade principal",
-                "related_entities": ["lista de entidades relacionadas"],
-                "lat": latitude consolidada,
-                "lon": longitude consolidada,
-                "confidence": confiança consolidada (0.0-1.0),
-                "precision_radius": raio de precisão em metros
-            }}
-        ]
-    }}
-    """
-    
-    # CAMADA 5: Finalização e validação semântica
-    final_validation_prompt = f"""
-    Realize a validação semântica final das coordenadas identificadas:
-    
-    Texto original: "{text}"
-    
-    Para cada coordenada consolidada:
-    1. Verifique a coerência com o contexto completo do texto
-    2. Garanta que a entidade identificada tem relevância no contexto descrito
-    3. Atribua um tipo semântico preciso (cidade, rio, floresta, etc.)
-    4. Determine um nome descritivo que melhor represente o ponto no contexto
-    
-    IMPORTANTE: Retorne APENAS um array JSON no seguinte formato:
-    [
-        {{
-            "lat": latitude final,
-            "lon": longitude final,
-            "name": "nome descritivo do local",
-            "type": "tipo semântico",
-            "semantic_weight": peso semântico final (0.0-1.0)
-        }}
-    ]
-    
-    APENAS JSON PURO, sem explicações ou comentários adicionais.
-    """
-    
-    # Executar pipeline de processamento em camadas
-    print("Camada 1: Decomposição semântica...")
-    semantic_result = query_gemini_api(semantic_decomposition_prompt)
-    
-    print("Camada 2: Identificação de entidades geográficas...")
-    entities_result = query_gemini_api(geo_entities_prompt)
-    
-    print("Camada 3: Análise fuzzy de coordenadas...")
-    fuzzy_result = query_gemini_api(fuzzy_coordinates_prompt)
-    
-    print("Camada 4: Colapso de dados por teoria de conjuntos...")
-    consolidation_result = query_gemini_api(set_theory_prompt)
+                with _SESSION.post(_GEMINI_STREAM_URL, headers=headers, data=body,
+                                   timeout=_HTTP_TIMEOUT, stream=True) as response:
+                    if response.status_code == 200:
+                        # Sucesso só quando o array chega completo; corpo
+                        # truncado ou sem array conta como tentativa falha
+                        array_text = _read_streamed_array(response)
+                        if array_text is not None:
+                            _circuit_breaker.record_success()
+                            return array_text
+                    else:
+                        error_text = response.text
+            except orjson.JSONDecodeError as e:
+                _LOG.warning("Erro ao processar resposta da API: %s", e)
+                response = None
+            except requests.exceptions.RequestException as e:
+                _LOG.warning("Erro na requisição à API Gemini: %s", e)
+                response = None
+            else:
+                if response.status_code != 200:
+                    _LOG.warning("Erro na API Gemini: %s - %s", response.status_code, error_text)
+                    if response.status_code not in _RETRY_STATUS:
+                        # Erros do cliente (chave inválida, requisição malformada) não se resolvem repetindo
+                        return None
+            
+            if last_attempt:
+                break
+            time.sleep(_backoff_delay(attempt, response))
+        
+        _circuit_breaker.record_failure()
+        return None
     
-    print("Camada 5: Validação semântica final...")
-    final_result = query_gemini_api(final_validation_prompt)
+    # As cinco camadas são resolvidas numa única chamada: o prompt de
+    # create_gemini_prompt descreve o pipeline completo, evitando reenviar o
+    # texto e o preâmbulo a cada camada.
+    _LOG.debug("Processando camadas 1-5 em prompt único...")
+    final_result = query_gemini_api(create_gemini_prompt(text), temperature=0)
     
     # Processamento do resultado final
     if final_result:
         try:
-            # Encontrar o primeiro array JSON no texto
-            json_match = re.search(r'\[\s*{.*}\s*\]', final_result, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                coordinates = json.loads(json_str)
-                
+            # Saída estruturada: o texto da resposta já é o array JSON
+            coordinates = orjson.loads(final_result)
+            if isinstance(coordinates, list):
                 # Ordenar coordenadas por peso semântico
-                if coordinates and isinstance(coordinates, list):
-                    coordinates.sort(key=lambda x: x.get('semantic_weight', 0), reverse=True)
-                
-                return coordinates
+                return tuple(_sort_by_weight([Coordinate.from_dict(c) for c in coordinates]))
             else:
-                print("Formato de coordenadas não identificado na resposta final.")
-                return []
+                _LOG.warning("Formato de coordenadas não identificado na resposta final.")
+                return ()
         except Exception as e:
-            print(f"Erro ao processar resultado final: {e}")
-            return []
+            _LOG.warning("Erro ao processar resultado final: %s", e)
+            return ()
     
-    return []
+    return ()
+
+class _NoCoordinatesError(Exception):
+    """Extração sem resultado; a exceção impede que o st.cache_data armazene a falha."""
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _cached_semantic_extract(text, _api_key):
+    """
+    Extração semântica memorizada entre reexecuções do script Streamlit.
+    
+    A chave do cache é apenas o texto: o prefixo `_` exclui a chave da API do
+    hash, de modo que trocá-la não invalida os resultados.
+    """
+    coordinates = extract_geo_entities_semantic(text, _api_key)
+    if not coordinates:
+        raise _NoCoordinatesError()
+    return coordinates
 
 # Função para uso no Streamlit
 def enhanced_geo_extract(text, api_key):
     """Versão simplificada para integração com Streamlit"""
-    import streamlit as st
-    
     with st.spinner("Processando análise semântica avançada..."):
-        coordinates = extract_geo_entities_semantic(text, api_key)
+        try:
+            coordinates = _cached_semantic_extract(text, api_key)
+        except _NoCoordinatesError:
+            coordinates = []
         
         if not coordinates:
             st.warning("Não foi possível identificar coordenadas precisas. Usando valores padrão.")
@@ -262,53 +612,4 @@ def enhanced_geo_extract(text, api_key):
 # Exemplo de uso em prompt único para API Gemini
 def create_gemini_prompt(text):
     """Cria um prompt único para processamento completo na API Gemini"""
-    prompt = f"""
-    Analise semanticamente o seguinte texto para extrair coordenadas geodésicas com alta precisão:
-    
-    TEXTO: "{text}"
-    
-    INSTRUÇÕES DE PROCESSAMENTO:
-    
-    1. DECOMPOSIÇÃO SEMÂNTICA:
-       - Identifique núcleos nominais relacionados a locais
-       - Extraia núcleos verbais indicando movimento/posição
-       - Reconheça modificadores espaciais e conjuntos preposicionais
-    
-    2. IDENTIFICAÇÃO DE ENTIDADES GEOGRÁFICAS:
-       - Bairros, ruas, monumentos, prédios
-       - Relevos, montanhas, rios famosos
-       - Áreas naturais, cidades, referências direcionais
-       - Atribua peso de confiança (0-1) por especificidade
-    
-    3. ANÁLISE FUZZY:
-       - Determine coordenadas para cada entidade
-       - Atribua grau de pertinência (0-1)
-       - Identifique raio de dispersão aproximado
-       - Calcule relevância contextual
-    
-    4. COLAPSO POR TEORIA DE CONJUNTOS:
-       - Identifique interseções por proximidade
-       - Calcule conjunto mínimo com fidelidade semântica
-       - Elimine outliers por distância e relevância
-       - Aplique regras de prioridade (específico>genérico, direto>indireto)
-    
-    5. VALIDAÇÃO SEMÂNTICA FINAL:
-       - Verifique coerência com contexto completo
-       - Garanta relevância no contexto
-       - Atribua tipo semântico preciso
-       - Determine nome descritivo representativo
-    
-    IMPORTANTE: Retorne APENAS um array JSON com esta estrutura:
-    [
-        {{
-            "lat": latitude final,
-            "lon": longitude final,
-            "name": "nome descritivo do local",
-            "type": "tipo semântico preciso",
-            "semantic_weight": peso semântico final (0.0-1.0)
-        }}
-    ]
-    
-    RETORNE APENAS O JSON, sem explicações ou comentários.
-    """
-    return prompt
+    return _EXTRACTION_PROMPT_TEMPLATE.format(text=text)